@@ -0,0 +1,36 @@
+import bisect
+
+# (low kHz, high kHz, name)
+BANDS = [
+    (1800, 2000, '160m'),
+    (3500, 4000, '80m'),
+    (5330, 5410, '60m'),
+    (7000, 7300, '40m'),
+    (10100, 10150, '30m'),
+    (14000, 14350, '20m'),
+    (18068, 18168, '17m'),
+    (21000, 21450, '15m'),
+    (24890, 24990, '12m'),
+    (28000, 29700, '10m'),
+    (50000, 54000, '6m'),
+    (144000, 148000, '2m'),
+    (420000, 450000, '70cm'),
+]
+
+_lows = [b[0] for b in BANDS]
+
+
+def get_band(freq) -> str:
+    '''
+    Return the band name for a frequency in kHz. Returns 'other' for
+    frequencies outside of the amateur bands or that can't be parsed.
+    '''
+    try:
+        f = float(freq)
+    except (TypeError, ValueError):
+        return 'other'
+
+    i = bisect.bisect_right(_lows, f) - 1
+    if i >= 0 and f <= BANDS[i][1]:
+        return BANDS[i][2]
+    return 'other'
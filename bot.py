@@ -1,37 +1,39 @@
 # noqa E501
 
-import asyncio
 import calendar
+import hashlib
 import json
 import logging
 import logging.handlers
-import os
-import re
 import sys
-import urllib.parse
 from datetime import datetime, timezone, timedelta
 
 import aiohttp
 import discord
-from cache import AsyncTTL
 from discord.ext import tasks
 from discord import app_commands
 
+from config import Config
+from delivery import ChannelDelivery, WebhookDelivery
+from history import SpotHistory
+from lease import Lease
+from prefix_index import PrefixIndex
 from schedule import Schedule
+from subscriptions import DELIVERY_TYPES, Subscriptions
+from spot import get_basecall, validate_call
+from spots import (Poller, _get_callsign_list, get_callsign_list,
+                   mutex_lock, park_index)
 
-mutex_lock = asyncio.Lock()
+TREE_HASH_FILE = "command_tree.hash"
 
-POTA_SPOT_URL = "https://api.pota.app/spot/activator"
-ACTIVATOR_INFO_URL = "https://api.pota.app/stats/user/{call}"
+cfg = Config()
+token = cfg.token
+guild_id = cfg.guild_id
 
-token = os.environ['BOT_TOKEN']
-guild_id = int(os.environ['GUILD_ID'])
-channel_id = int(os.environ['CHANNEL_ID'])
-callsign_role_id = int(os.environ['CALLSIGN_MGR_ROLE_ID'])
-ping_role = int(os.environ['PING_ROLE_ID'])
-# default disable_rbn to FALSE
-disable_rbn = int(os.environ.get('DISABLE_RBN', '0'))
-rbn_api_hdr = os.environ['RBN_HDR']
+history = SpotHistory()
+subscriptions = Subscriptions()
+call_index = PrefixIndex()
+msg_index = PrefixIndex()
 
 #handler = logging.handlers.RotatingFileHandler(
 #    filename='discord.log',
@@ -45,211 +47,10 @@ handler = logging.StreamHandler(sys.stdout)
 
 log = logging.getLogger("discord")
 
-test_msg = {
-    "content": "",
-    "tts": False,
-    "embeds": [
-        {
-            "title": "N7OOS - - - *US-11254*  - - -  (SSB on 14285 MHz)",
-            "description": "2024-01-01 14:50 • park • profile • qrz",
-            "color": 2326507,
-            "fields": [
-                {
-                    "name": "Activator",
-                    "value": "Jim Vaughn"
-                },
-                {
-                    "name": "Location",
-                    "value": "US-FL",
-                    "inline": False
-                },
-                {
-                    "name": "Comments",
-                    "value": "",
-                    "inline": False
-                }
-            ],
-            "thumbnail": {
-                "url": ""
-            }
-        }
-    ],
-    "components": [],
-    "actions": {},
-    "username": "MGRA Bot"
-}
-
-rbn_msg = {
-    "content": "",
-    "tts": False,
-    "embeds": [
-        {
-            "title": "",
-            "description": "",
-            "color": 8383267,
-            "fields": [
-                {
-                    "name": "Type",
-                    "value": "RBN"
-                },
-                {
-                    "name": "Spotted By",
-                    "value": ""
-                },
-            ],
-        }
-    ],
-    "components": [],
-    "actions": {},
-    "username": "MGRA Bot"
-}
-
-
-def get_basecall(callsign: str) -> str:
-    '''
-    Get the base component of a given callsign (ie. the callsign without '/P'
-    suffixes or country prefixes ie 'W4/').
-    '''
-    if callsign is None:
-        return ""
-
-    if "/" in callsign:
-        basecall = max(
-            callsign.split("/")[0],
-            callsign.split("/")[1],
-            key=len)
-    else:
-        basecall = callsign
-    return basecall
-
-
-def validate_call(callsign: str) -> bool:
-    '''
-    Validates a callsign.
-
-    The format should be pretty normal US amateur radio callsign.
-    '''
-    base = get_basecall(callsign)
-    pattern = r'\d?[a-zA-Z]{1,2}\d{1,4}[a-zA-Z]{1,4}'
-    m = re.match(pattern, base)
-
-    if m:
-        return True
-    return False
-
-
-async def get_spots(session):
-    '''Return all current spots from POTA API'''
-    async with session.get(POTA_SPOT_URL) as response:
-        if response.status == 200:
-            return await response.json()
-        else:
-            return []
-
-
-async def get_rbn_spots(session, calls: list[str], last_id: int):
-    '''Return RBN spots for each callsign in the given list'''
-    spots, last_id = await query_rbn(session, calls, last_id)
-
-    return spots, last_id
-
-
-def convert_rbn_to_pota_spot(j, spot):
-    arr = j['spots'][spot]
-    t = datetime.fromtimestamp(arr[10], tz=timezone.utc)
-    timestamp = t.isoformat()
-    snr = arr[3]
-    wpm = arr[4]
-    return {
-        'activator': arr[2],
-        'frequency': arr[1],
-        'mode': 'CW',         # URL only gets CW spots
-        'spotTime': timestamp,
-        'comments': '##RBN##',  # hijack comment field for flag
-        'reference': f'de {arr[0]}',
-        'name': f'{snr} db • {wpm} wpm',
-        'locationDesc': ''
-    }
-
-
-async def query_rbn(session, calls: list[str], last_id: int):
-
-    # h = returned as "ver_h": "2aa296" (version header)
-    # ma = max age in seconds
-    # m = 1 (CW)
-    # bc = 1 (CQ)
-    # s = last_id
-    # r = max rows (100 is highest)
-    # cdx = callsign to look for
-
-    # get expected hdr from ENV var
-    expected_ver = rbn_api_hdr  # '2aa296'
-
-    calls = [urllib.parse.quote(call) for call in calls]
-    url = f'https://www.reversebeacon.net/spots.php?h={expected_ver}&ma=60&m=1&bc=1&s={last_id}&r=100&cdx={",".join(calls)}'
-
-    async with session.get(url) as response:
-        if response.status == 200:
-            j = await response.json()
-
-            # log.info(f"rbn response {call} = {json.dumps(j, indent=4)}")
-
-            ver = j.get('ver_h')
-
-            if ver != expected_ver:
-                log.warning(f'RBN API Version mismatch! Expected {expected_ver} but got {ver}')
-                return [{
-                    'activator': 'ERROR',
-                    'frequency': 'ERROR',
-                    'mode': 'CW',
-                    'spotTime': datetime.now(timezone.utc),
-                    'comments': '##ERROR##',  # hijack comment field for flag
-                    'reference': '',
-                    'name': 'Error RBN VERSION MISMATCH',
-                    'locationDesc': ''
-                }], 0
-
-            # log.info(f"rbn ver {ver}")
-
-            spots = {}
-            last_id = max(j.get('lastid_c'), last_id)
-            for spot_id in sorted(j.get('spots', {})):
-                spot = convert_rbn_to_pota_spot(j, spot_id)
-                spots[spot['activator']] = spot
-                last_id = max(int(spot_id), last_id)
-            return list(spots.values()), last_id
-        else:
-            log.error(f"error getting spots from rbn: {response.status}")
-    return [], 0
-
-
-@AsyncTTL(time_to_live=6 * 60 * 60, skip_args=1)  # 6hours
-async def get_activator_stats(session, activator: str):
-    '''Return all spot + comments from a given activation'''
-    s = get_basecall(activator)
-
-    url = ACTIVATOR_INFO_URL.format(call=s)
-    async with session.get(url) as response:
-        if response.status == 200:
-            return await response.json()
-        else:
-            return None
-
-
-async def get_callsign_list() -> list[str]:
-    async with mutex_lock:
-        return _get_callsign_list()
-
-
-def _get_callsign_list() -> list[str]:
-    with open(file="callsigns.txt", mode="r") as f:
-        lines = f.readlines()
-
-    return [s.strip() for s in lines]
-
 
 async def add_callsign(callsign: str):
     async with mutex_lock:
+        call_index.load_if_changed("callsigns.txt", _get_callsign_list)
         calls = _get_callsign_list()
         if callsign in calls:
             return
@@ -260,197 +61,49 @@ async def add_callsign(callsign: str):
         calls.append(callsign)
         with open(file="callsigns.txt", mode="w") as f:
             f.write('\n'.join(calls))
+        call_index.add(callsign)
+        call_index.mark_current("callsigns.txt")
 
 
 async def remove_callsign(callsign: str):
     async with mutex_lock:
+        call_index.load_if_changed("callsigns.txt", _get_callsign_list)
         calls = _get_callsign_list()
         if callsign not in calls:
             return
         calls.remove(callsign)
         with open(file="callsigns.txt", mode="w") as f:
             f.write('\n'.join(calls))
+        call_index.remove(callsign)
+        call_index.mark_current("callsigns.txt")
 
 
-async def build_pota_embed(session, spot: any) -> str:
-    '''
-    The bulk of the work is done here to format spot data into a nice looking
-    discord embed
-
-    @param spot any: a spot from the pota api
-    '''
-    def get_title(act, ref, mode, freq):
-        return f"{act} — *{reference}*  —  {freq} ({mode})"
-
-    def get_act_title(name, actx, qsos):
-        return f"_{name}_   ( **{actx}** actx / **{qsos}** qs )"
-
-    def get_gravatar(id):
-        return f"https://gravatar.com/avatar/{id}?d=identicon"
-
-    def get_description(ref, call, timestamp):
-        park_url = f"https://pota.app/#/park/{ref}"
-        act_url = f"https://pota.app/#/profile/{get_basecall(call)}"
-        qrz_url = f"https://www.qrz.com/db/{call}"
-        return f"{timestamp} • [park]({park_url}) • [profile]({act_url}) • [qrz]({qrz_url})"
-
-    act = spot['activator']
-    freq = spot['frequency']
-    mode = spot['mode']
-    reference = spot['reference']
-    park_name = spot['name']
-    locations = spot['locationDesc']
-    timestamp = spot['spotTime']
-
-    test_msg["embeds"][0]['title'] = get_title(act, reference, mode, freq)
-    test_msg["embeds"][0]['description'] = get_description(reference, act, timestamp)
-
-    act_info = await get_activator_stats(session, act)
-    act_info_unknown = {
-        "callsign": "unknown",
-        "name": "unknown",
-        "qth": "unknown",
-        "gravatar": "",
-        "activator": {
-            "activations": '?',
-            "parks": '?',
-            "qsos": '?'
-        },
-        "attempts": {
-            "activations": '?',
-            "parks": '?',
-            "qsos": '?'
-        },
-        "hunter": {
-            "parks": '?',
-            "qsos": '?'
-        },
-        "awards": '?',
-        "endorsements": '?'
-    }
-    if act_info is None:
-        act_info = act_info_unknown
-
-    actx = act_info['activator']['activations']
-    qsos = act_info['activator']['qsos']
-    name = act_info['name']
-    gravatar_id = act_info['gravatar']
-    test_msg["embeds"][0]['thumbnail']['url'] = get_gravatar(gravatar_id)
-
-    test_msg["embeds"][0]['fields'][0]['value'] = get_act_title(
-        name, actx, qsos)
-    test_msg["embeds"][0]['fields'][1]['value'] = f"{park_name}\n{locations}"
-    test_msg["embeds"][0]['fields'][2]['value'] = spot['comments']
-
-    return test_msg
-
-
-def build_rbn_embed(spot: any) -> str:
-    '''
-    The bulk of the work is done here to format spot data into a nice looking
-    discord embed
-
-    @param spot any: a spot from the pota api
-    '''
-    def get_title(act, mode, freq):
-        return f"{act} —  {freq} ({mode})"
-
-    def get_description(call, timestamp):
-        rbn_url = f"https://www.reversebeacon.net/main.php?spotted_call={call}&rows=100"
-        qrz_url = f"https://www.qrz.com/db/{call}"
-        return f"{timestamp} • [rbn]({rbn_url}) • [qrz]({qrz_url})\n"
-
-    act = spot['activator']
-    freq = spot['frequency']
-    mode = spot['mode']
-    timestamp = spot['spotTime']
-
-    rbn_msg["embeds"][0]['title'] = get_title(act, mode, freq)
-    rbn_msg["embeds"][0]['description'] = get_description(act, timestamp)
-
-    # reference is 'spotted by X' for RBN
-    spotby = spot['reference'] + ' • ' + spot['name']
-    rbn_msg["embeds"][0]['fields'][1]['value'] = spotby
+def _get_msg_names() -> list[str] | None:
+    sched = Schedule.get_schedule()
+    if sched is None:
+        return None
+    return sched.names
 
-    return rbn_msg
 
+async def callsign_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    call_index.load_if_changed("callsigns.txt", _get_callsign_list)
+    return [app_commands.Choice(name=c, value=c) for c in call_index.search(current)]
 
-class Storage:
-    def __init__(self):
-        self.schedule = None
-        self.spots = {}
 
-    def add_spot(self, spot: any):
-        self.spots[spot['activator']] = {
-            'timestamp': datetime.now(timezone.utc),
-            'spot': spot,
-            'qrt': False
-        }
+async def msg_name_autocomplete(interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+    try:
+        msg_index.load_if_changed("schedule.json", _get_msg_names)
+    except Exception:
+        # a bad schedule file is reported by the commands themselves
+        pass
+    return [app_commands.Choice(name=n, value=n) for n in msg_index.search(current)]
 
-    def check_freq(self, a: float, b: float):
-        try:
-            x = float(a)
-            y = float(b)
-
-            return (abs(x - y) >= 0.2)
-        except Exception as e:
-            print(f"error comparing frequency: {e}")
-            log.error("error comparing frequency", exc_info=1)
-            return False
-
-    def check_spot(self, spot: any):
-        act = spot['activator']
-        cmt = str(spot['comments'])
-        new_time = datetime.fromisoformat(spot['spotTime']).replace(tzinfo=timezone.utc)
-
-        # if for some reason this spot is super old we dont want to process it
-        # at all. assume it's in the list by mistake.
-        #   (RBN started ignoring max age for ex)
-        if (datetime.now(timezone.utc) - new_time) > timedelta(minutes=31):
-            return False
-
-        old_spot = self.spots.get(act)
-        if old_spot is None:
-            if "qrt" not in cmt.lower():
-                self.add_spot(spot)
-                return True
-        else:
-            old_freq = old_spot['spot']['frequency']
-            old_mode = old_spot['spot']['mode']
-            new_freq = spot['frequency']
-            new_mode = str(spot['mode'])
-
-            freq_changed = self.check_freq(old_freq, new_freq)
-
-            if freq_changed and not new_mode.startswith('FT'):
-                self.add_spot(spot)
-                return True
-            elif old_mode != new_mode:
-                self.add_spot(spot)
-                return True
-            elif "qrt" in cmt.lower() and not old_spot['qrt']:
-                old_spot['qrt'] = True
-                return True
-        return False
-
-    def expire(self):
-        # remove any old spots we have
-        now = datetime.now(timezone.utc)
-        for act in list(self.spots.keys()):
-            if now - self.spots[act]['timestamp'] > timedelta(minutes=30):
-                del self.spots[act]
-
-    def get_schedule(self) -> any:
-        try:
-            with open(file="schedule.json", mode="r", encoding='utf8') as f:
-                lines = f.read()
-                self.schedule = json.loads(lines)
-        except Exception as ex:
-            print(f"Error getting schedule file: {ex}")
-            log.error("Error getting schedule file", exc_info=ex)
-            self.schedule = None
 
-        return self.schedule
+async def subscribed_call_autocomplete(interaction: discord.Interaction,
+                                       current: str) -> list[app_commands.Choice[str]]:
+    sub = subscriptions.get(interaction.user.id)
+    calls = sorted(c for c in sub['calls'] if c.startswith(current.upper())) if sub else []
+    return [app_commands.Choice(name=c, value=c) for c in calls[:25]]
 
 
 class MgraBot(discord.Client):
@@ -460,75 +113,130 @@ class MgraBot(discord.Client):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.storage = Storage()
         self.tree = app_commands.CommandTree(self)
-        self.last_id = 0
+
+        if cfg.webhook_url:
+            self.delivery = WebhookDelivery(cfg.webhook_url)
+        else:
+            self.delivery = ChannelDelivery(self, cfg)
+        lease = Lease(cfg.lease_db, cfg.instance_name, cfg.lease_ttl) if cfg.lease_db else None
+        self.poller = Poller(self.delivery, cfg, history, subscriptions, lease=lease)
 
     async def setup_hook(self) -> None:
-        synced = await self.tree.sync(guild=discord.Object(id=guild_id))
-        log.info(f"synced {synced}")
-        # start the task to run in the background
-        self.my_background_task.start()
+        await self.sync_tree()
+        # start the task to run in the background. spots can be posted by
+        # worker.py instead, then only the slash commands are run here
+        if not cfg.disable_spot_task:
+            self.my_background_task.start()
+        self.reload_config.start()
         self.check_scheduled_msgs.start()
+        self.refresh_parks.start()
+        self.flush_history.start()
+        if self.poller.lease is not None:
+            self.check_lease.change_interval(seconds=self.poller.lease.ttl / 3)
+            self.check_lease.start()
+
+    async def sync_tree(self):
+        '''
+        Sync the slash commands with discord only if they changed since the
+        last sync. The hash of the last synced tree, application and guild is
+        kept in a file.
+        '''
+        guild = discord.Object(id=guild_id)
+        cmds = [cmd.to_dict() for cmd in self.tree.get_commands(guild=guild)]
+        digest = hashlib.sha256(
+            json.dumps([self.application_id, guild_id, cmds], sort_keys=True).encode('utf-8')).hexdigest()
+
+        try:
+            with open(file=TREE_HASH_FILE, mode="r") as f:
+                if f.read().strip() == digest:
+                    log.info("command tree unchanged, skipping sync")
+                    return
+        except OSError:
+            pass
+
+        synced = await self.tree.sync(guild=guild)
+        log.info(f"synced {synced}")
+
+        with open(file=TREE_HASH_FILE, mode="w") as f:
+            f.write(digest)
+
+    async def close(self):
+        if self.poller.leader:
+            # let the standby take over right away
+            self.poller.lease.release()
+        await self.delivery.close()
+        await super().close()
 
     async def on_ready(self):
         log.info(f'onready: Logged in as {self.user} (ID: {self.user.id})')
 
-    @tasks.loop(seconds=60)
-    async def my_background_task(self):
-        channel = self.get_channel(channel_id)
-        calls = await get_callsign_list()
+    @tasks.loop(seconds=15)
+    async def reload_config(self):
+        '''
+        Pick up config.json changes. Runs on its own so role changes apply
+        even when the spot task is disabled.
+        '''
+        try:
+            cfg.reload_if_changed()
+        except Exception as ex:
+            log.error("Error reloading config", exc_info=ex)
 
+    @tasks.loop(seconds=15)
+    async def my_background_task(self):
         async with aiohttp.ClientSession() as session:
-            pota_spots = get_spots(session)
-            if not disable_rbn:
-                rbn_spots = get_rbn_spots(session, calls, self.last_id)
-                both_spots = await asyncio.gather(pota_spots, rbn_spots)
-                spots = both_spots[0] + both_spots[1][0]
-                self.last_id = both_spots[1][1]
-            else:
-                spots = await pota_spots
-
-            # log.info(f"all spots {json.dumps(spots, indent=2)}")
-
-            for spot in spots:
-                if spot is None:
-                    continue
-                act = spot['activator']
-                act = get_basecall(act)
-
-                if spot['comments'] == '##ERROR##':
-                    err_msg = spot['name']
-                    await channel.send(content=f'<@&{ping_role}> {err_msg}')
-
-                if act in calls:
-                    must_send = self.storage.check_spot(spot)
-
-                    if must_send:
-                        if spot['comments'] == '##RBN##':
-                            msg = build_rbn_embed(spot)
-                            spot_type = 'RBN'
-                        else:
-                            msg = await build_pota_embed(session, spot)
-                            spot_type = 'POTA'
-
-                        embed = discord.Embed.from_dict(msg['embeds'][0])
-                        await channel.send(
-                            content=f'<@&{ping_role}> {spot_type} SPOT',
-                            embed=embed)
-        self.storage.expire()
+            await self.poller.tick(session)
 
     @my_background_task.before_loop
     async def before_my_task(self):
         # wait until the bot logs in
         await self.wait_until_ready()
 
+    @tasks.loop(seconds=3)
+    async def check_lease(self):
+        '''
+        Renew the active/standby lease or take it over. Only the instance
+        holding it posts spots and scheduled messages.
+        '''
+        try:
+            async with aiohttp.ClientSession() as session:
+                await self.poller.check_lease(session)
+        except Exception as ex:
+            log.error("Error checking lease", exc_info=ex)
+
+    @tasks.loop(hours=1)
+    async def refresh_parks(self):
+        '''
+        Rebuild the local park index once a day. Checked hourly so a restart
+        doesn't download the park list again.
+        '''
+        if not park_index.is_stale(24 * 60 * 60):
+            return
+        try:
+            async with aiohttp.ClientSession() as session:
+                await park_index.refresh(session)
+        except Exception as ex:
+            log.error("Error refreshing park index", exc_info=ex)
+
+    @tasks.loop(seconds=15)
+    async def flush_history(self):
+        '''
+        Write the spots buffered by the spot task to the history db.
+        '''
+        try:
+            await history.flush()
+        except Exception as ex:
+            log.error("Error writing spot history", exc_info=ex)
+
     @tasks.loop(seconds=60)
     async def check_scheduled_msgs(self):
         '''
         This Background task executes every minute to check the time and see if
         there are scheduled messages to send. If so send the configured message.
         '''
+        if not self.poller.is_active():
+            return
+
         schedule = Schedule.get_schedule()
 
         if schedule is None:
@@ -561,6 +269,23 @@ class MgraBot(discord.Client):
         await channel.send(content=msg_content, embeds=embeds)
 
 
+def has_callsign_mgr_role():
+    '''
+    Same as app_commands.checks.has_role but reads the role id from the
+    current config so it can be changed without restarting.
+    '''
+    def predicate(interaction: discord.Interaction) -> bool:
+        if not isinstance(interaction.user, discord.Member):
+            raise app_commands.NoPrivateMessage()
+
+        role_id = cfg.callsign_role_id
+        if interaction.user.get_role(role_id) is None:
+            raise app_commands.MissingRole(role_id)
+        return True
+
+    return app_commands.check(predicate)
+
+
 mentions = discord.AllowedMentions(roles=True, users=True, everyone=True)
 
 
@@ -605,7 +330,7 @@ async def show_call_cmd_error(interaction: discord.Interaction, error):
     guild=discord.Object(id=guild_id),
 )
 @app_commands.describe(callsign='The callsign to add to the tracking list.')
-@app_commands.checks.has_role(callsign_role_id)
+@has_callsign_mgr_role()
 async def add_call_cmd(interaction: discord.Interaction, callsign: str):
     log.info(f"adding callsign {callsign}. user: {interaction.user} - {interaction.user.id}")
     await add_callsign(callsign.upper())
@@ -628,7 +353,8 @@ async def add_call_cmd_error(interaction: discord.Interaction, error):
     guild=discord.Object(id=guild_id)
 )
 @app_commands.describe(callsign='The callsign to remove from the tracking list')
-@app_commands.checks.has_role(callsign_role_id)
+@app_commands.autocomplete(callsign=callsign_autocomplete)
+@has_callsign_mgr_role()
 async def remove_call_cmd(interaction: discord.Interaction, callsign: str):
     log.info(f"removing callsign {callsign}. user: {interaction.user} - {interaction.user.id}")
     await remove_callsign(callsign.upper())
@@ -679,17 +405,17 @@ async def show_msgs_cmd_error(interaction: discord.Interaction, error):
     guild=discord.Object(id=guild_id)
 )
 @app_commands.describe(msg_name='Name of the scheduled message to view.')
+@app_commands.autocomplete(msg_name=msg_name_autocomplete)
 async def view_msg_cmd(interaction, msg_name: str):
     sched = Schedule.get_schedule()
 
-    msg_content = ""
-    embeds = []
-    if sched:
-        for msg in sched.messages:
-            if (msg['name'] == msg_name):
-                j = json.dumps(msg['embeds'], indent=4)
-                msg_embed = f"Embeds:\n```json\n{j}```\n"
-                msg_content, embeds = Schedule.get_scheduled_msg(msg)
+    msg = sched.get_msg(msg_name) if sched else None
+    if msg is None:
+        raise ValueError(f"msg {msg_name} not found")
+
+    j = json.dumps(msg['embeds'], indent=4)
+    msg_embed = f"Embeds:\n```json\n{j}```\n"
+    msg_content, embeds = Schedule.get_scheduled_msg(msg)
 
     await interaction.response.send_message(f"### msg {msg_name}\n{msg_embed}\nHere's what it looks like:\n{msg_content}", embeds=embeds, ephemeral=True)
 
@@ -710,12 +436,16 @@ async def view_msg_cmd_error(interaction: discord.Interaction, error):
     guild=discord.Object(id=guild_id)
 )
 @app_commands.describe(msg_name='Name of the scheduled message')
+@app_commands.autocomplete(msg_name=msg_name_autocomplete)
 @app_commands.describe(new_time='Time is in UTC timezone. The format is a 24-hour, 4 digit string ex: 23:30 or 01:45')
 @app_commands.describe(day_of_week='Optional. New day-of-week number. Mon==0, Tue==1, etc')
-@app_commands.checks.has_role(callsign_role_id)
+@has_callsign_mgr_role()
 async def set_msg_time(interaction, msg_name: str, new_time: str, day_of_week: int = -1):
     sched = Schedule.get_schedule()
 
+    if sched is None or sched.get_msg(msg_name) is None:
+        raise ValueError(f"msg {msg_name} not found")
+
     if not sched.set_msg_time(msg_name, new_time, day_of_week):
         raise ValueError("given time is not valid")
 
@@ -738,12 +468,16 @@ async def set_msg_time_error(interaction: discord.Interaction, error):
     guild=discord.Object(id=guild_id)
 )
 @app_commands.describe(msg_name='Name of the scheduled message')
+@app_commands.autocomplete(msg_name=msg_name_autocomplete)
 @app_commands.describe(new_text='Required. New text string to display')
 @app_commands.describe(new_embed_json='Optional. JSON data for the embed. Use /viewmsg to copy current embed JSON')
-@app_commands.checks.has_role(callsign_role_id)
+@has_callsign_mgr_role()
 async def set_msg_content(interaction, msg_name: str, new_text: str, new_embed_json: str = ""):
     sched = Schedule.get_schedule()
 
+    if sched is None or sched.get_msg(msg_name) is None:
+        raise ValueError(f"msg {msg_name} not found")
+
     if not sched.set_msg_content(msg_name, new_text, new_embed_json):
         raise ValueError("Error setting msg content")
 
@@ -766,11 +500,15 @@ async def set_msg_content_error(interaction: discord.Interaction, error):
     guild=discord.Object(id=guild_id)
 )
 @app_commands.describe(msg_name='Name of the scheduled message')
+@app_commands.autocomplete(msg_name=msg_name_autocomplete)
 @app_commands.describe(value='0=disabled, 1=enabled')
-@app_commands.checks.has_role(callsign_role_id)
+@has_callsign_mgr_role()
 async def set_msg_enabled(interaction, msg_name: str, value: int):
     sched = Schedule.get_schedule()
 
+    if sched is None or sched.get_msg(msg_name) is None:
+        raise ValueError(f"msg {msg_name} not found")
+
     if not sched.set_msg_enabled(msg_name, value):
         raise Exception("Error writing to schedule file.")
 
@@ -782,6 +520,180 @@ async def set_msg_enabled_error(interaction: discord.Interaction, error):
     await interaction.response.send_message(f"Error: _{error}_", ephemeral=True)
 
 
+###
+# STATS COMMANDS
+###
+
+
+stats_group = app_commands.Group(
+    name="stats",
+    description="Statistics from the spot history",
+    guild_ids=[guild_id]
+)
+
+
+@stats_group.command(
+    name="top",
+    description="Top POTA activators this month"
+)
+@app_commands.describe(count='Optional. Number of activators to show (default 10)')
+async def stats_top_cmd(interaction: discord.Interaction, count: int = 10):
+    month_start = datetime.now(timezone.utc).replace(day=1)
+    rows = await history.top_activators(month_start, min(max(count, 1), 25))
+
+    msg = ""
+    for call, spots, days in rows:
+        msg += f"`{call:<8}` {spots} spots on {days} days\n"
+
+    await interaction.response.send_message(f"### Top activators this month\n{msg}", ephemeral=True)
+
+
+@stats_group.command(
+    name="mix",
+    description="Band and mode mix of spots"
+)
+@app_commands.describe(days='Optional. Number of days to include (default 30)')
+async def stats_mix_cmd(interaction: discord.Interaction, days: int = 30):
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    rows = await history.band_mode_mix(since)
+
+    msg = ""
+    for band, mode, spots in rows[:25]:
+        msg += f"`{band:<5} {mode:<5}` {spots}\n"
+
+    await interaction.response.send_message(f"### Band / mode mix last {days} days\n{msg}", ephemeral=True)
+
+
+@stats_group.command(
+    name="snr",
+    description="Daily RBN SNR for a callsign"
+)
+@app_commands.describe(callsign='The callsign to show')
+@app_commands.autocomplete(callsign=callsign_autocomplete)
+@app_commands.describe(days='Optional. Number of days to include (default 30)')
+async def stats_snr_cmd(interaction: discord.Interaction, callsign: str, days: int = 30):
+    call = get_basecall(callsign.upper())
+    rows = await history.snr_trend(call, days)
+
+    msg = ""
+    for day, avg_snr, best_snr, reports in rows:
+        msg += f"`{day}` avg {avg_snr:.1f} db • best {best_snr} db • {reports} reports\n"
+
+    await interaction.response.send_message(f"### RBN SNR for {call}\n{msg}", ephemeral=True)
+
+
+@stats_group.error
+async def stats_cmd_error(interaction: discord.Interaction, error):
+    await interaction.response.send_message(f"Error: _{error}_", ephemeral=True)
+
+
+client.tree.add_command(stats_group)
+
+
+###
+# SUBSCRIPTION COMMANDS
+###
+
+
+sub_group = app_commands.Group(
+    name="sub",
+    description="Your personal spot subscriptions",
+    guild_ids=[guild_id]
+)
+
+
+@sub_group.command(
+    name="add",
+    description="Get notified of spots for a tracked callsign"
+)
+@app_commands.describe(callsign='A callsign from the tracking list')
+@app_commands.autocomplete(callsign=callsign_autocomplete)
+async def sub_add_cmd(interaction: discord.Interaction, callsign: str):
+    call = get_basecall(callsign.upper())
+    if call not in await get_callsign_list():
+        raise ValueError(f"{call} is not in the tracking list")
+
+    subscriptions.add_call(interaction.user.id, call)
+    await interaction.response.send_message(f"### Subscribed to {call}", ephemeral=True)
+
+
+@sub_group.command(
+    name="remove",
+    description="Stop getting notified of spots for a callsign"
+)
+@app_commands.describe(callsign='A callsign you are subscribed to')
+@app_commands.autocomplete(callsign=subscribed_call_autocomplete)
+async def sub_remove_cmd(interaction: discord.Interaction, callsign: str):
+    call = get_basecall(callsign.upper())
+    subscriptions.remove_call(interaction.user.id, call)
+    await interaction.response.send_message(f"### Unsubscribed from {call}", ephemeral=True)
+
+
+@sub_group.command(
+    name="bands",
+    description="Only get notified of spots on these bands"
+)
+@app_commands.describe(bands='Comma separated list ex: 20m,40m. Leave empty for all bands')
+async def sub_bands_cmd(interaction: discord.Interaction, bands: str = ""):
+    subscriptions.set_bands(interaction.user.id, bands.split(','))
+    await interaction.response.send_message(f"### Bands set to {bands or 'all'}", ephemeral=True)
+
+
+@sub_group.command(
+    name="modes",
+    description="Only get notified of spots in these modes"
+)
+@app_commands.describe(modes='Comma separated list ex: CW,SSB. Leave empty for all modes')
+async def sub_modes_cmd(interaction: discord.Interaction, modes: str = ""):
+    subscriptions.set_modes(interaction.user.id, modes.split(','))
+    await interaction.response.send_message(f"### Modes set to {modes or 'all'}", ephemeral=True)
+
+
+@sub_group.command(
+    name="delivery",
+    description="How you get notified of spots"
+)
+@app_commands.describe(how='mention = pinged in the spot post, dm = direct message')
+@app_commands.choices(how=[app_commands.Choice(name=x, value=x) for x in DELIVERY_TYPES])
+async def sub_delivery_cmd(interaction: discord.Interaction, how: str):
+    subscriptions.set_delivery(interaction.user.id, how)
+    await interaction.response.send_message(f"### Delivery set to {how}", ephemeral=True)
+
+
+@sub_group.command(
+    name="show",
+    description="Show your subscriptions"
+)
+async def sub_show_cmd(interaction: discord.Interaction):
+    sub = subscriptions.get(interaction.user.id)
+    if sub is None:
+        await interaction.response.send_message("You have no subscriptions.", ephemeral=True)
+        return
+
+    msg = f"callsigns: {', '.join(sorted(sub['calls'])) or 'none'}\n"
+    msg += f"bands: {', '.join(sorted(sub['bands'])) or 'all'}\n"
+    msg += f"modes: {', '.join(sorted(sub['modes'])) or 'all'}\n"
+    msg += f"delivery: {sub['delivery']}\n"
+    await interaction.response.send_message(f"### Your subscriptions\n{msg}", ephemeral=True)
+
+
+@sub_group.command(
+    name="clear",
+    description="Remove all of your subscriptions"
+)
+async def sub_clear_cmd(interaction: discord.Interaction):
+    subscriptions.remove_user(interaction.user.id)
+    await interaction.response.send_message("### Subscriptions removed", ephemeral=True)
+
+
+@sub_group.error
+async def sub_cmd_error(interaction: discord.Interaction, error):
+    await interaction.response.send_message(f"Error: _{error}_", ephemeral=True)
+
+
+client.tree.add_command(sub_group)
+
+
 ###
 # PINGME command - requires manage_roles permission on bot
 ###
@@ -793,6 +705,7 @@ async def set_msg_enabled_error(interaction: discord.Interaction, error):
     guild=discord.Object(id=guild_id)
 )
 async def give_role(interaction: discord.Interaction):
+    ping_role = cfg.ping_role
     role = discord.utils.get(interaction.guild.roles, id=ping_role)
 
     if role is None:
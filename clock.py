@@ -0,0 +1,46 @@
+import asyncio
+import time
+from datetime import datetime, timezone, timedelta
+
+
+class Clock:
+    '''
+    Source of the current time for the spot poller, spot storage and
+    webhook rate limiting. The default is the real clock, the soak test
+    harness swaps in a VirtualClock.
+    '''
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock(Clock):
+    '''
+    A clock that only moves when `advance` is called. `sleep` advances the
+    clock instead of waiting.
+    '''
+
+    def __init__(self, start: datetime):
+        self._now = start
+        self._mono = 0.0
+
+    def now(self) -> datetime:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._mono
+
+    def advance(self, seconds: float):
+        self._now += timedelta(seconds=seconds)
+        self._mono += seconds
+
+    async def sleep(self, seconds: float):
+        if seconds > 0:
+            self.advance(seconds)
+        await asyncio.sleep(0)
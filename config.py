@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import socket
+
+log = logging.getLogger("discord")
+
+
+class Config:
+    '''
+    Bot configuration.
+
+    Values come from environment variables and can be overridden by an
+    optional JSON file using the same names as keys. The file is checked
+    every time `reload_if_changed` is called so channel, role and RBN header
+    changes take effect without restarting the bot.
+
+    BOT_TOKEN and GUILD_ID can only be set by environment variable. Changing
+    them needs a new gateway connection anyway.
+    '''
+
+    BOT_REQUIRED = ('BOT_TOKEN', 'GUILD_ID', 'CHANNEL_ID', 'CALLSIGN_MGR_ROLE_ID', 'PING_ROLE_ID', 'RBN_HDR')
+    WORKER_REQUIRED = ('WEBHOOK_URL', 'PING_ROLE_ID', 'RBN_HDR')
+
+    def __init__(self, path: str = "config.json", required: tuple[str] = BOT_REQUIRED):
+        self.path = path
+        self._mtime = None
+        self._file = {}
+        self.reload_if_changed()
+
+        # fail at startup if anything required is missing
+        for key in required:
+            if key not in os.environ and key not in self._file:
+                raise KeyError(key)
+
+    def _get(self, key: str, default=None):
+        if key in self._file:
+            return self._file[key]
+        if default is None:
+            return os.environ[key]
+        return os.environ.get(key, default)
+
+    def reload_if_changed(self) -> bool:
+        '''
+        Reload the config file if it was modified. An invalid file is logged
+        and the last good values are kept.
+        '''
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        if mtime == self._mtime:
+            return False
+
+        if mtime is None:
+            self._file = {}
+        else:
+            try:
+                with open(file=self.path, mode="r", encoding='utf8') as f:
+                    data = json.load(f)
+                if not isinstance(data, dict):
+                    raise ValueError("config file must be a JSON object")
+                self._file = data
+            except Exception as ex:
+                # remember the mtime so a bad file is only reported once
+                self._mtime = mtime
+                log.error("Error reading config file", exc_info=ex)
+                return False
+
+        self._mtime = mtime
+        log.info(f"config loaded. file: {self.path if mtime else 'none'}")
+        return True
+
+    @property
+    def token(self) -> str:
+        return os.environ['BOT_TOKEN']
+
+    @property
+    def guild_id(self) -> int:
+        return int(os.environ['GUILD_ID'])
+
+    @property
+    def channel_id(self) -> int:
+        return int(self._get('CHANNEL_ID'))
+
+    @property
+    def callsign_role_id(self) -> int:
+        return int(self._get('CALLSIGN_MGR_ROLE_ID'))
+
+    @property
+    def ping_role(self) -> int:
+        return int(self._get('PING_ROLE_ID'))
+
+    @property
+    def disable_rbn(self) -> int:
+        # default disable_rbn to FALSE
+        return int(self._get('DISABLE_RBN', '0'))
+
+    @property
+    def rbn_api_hdr(self) -> str:
+        return str(self._get('RBN_HDR'))
+
+    @property
+    def home_grid(self) -> str:
+        # optional grid square used to show distance to parks
+        return str(self._get('HOME_GRID', ''))
+
+    @property
+    def webhook_url(self) -> str:
+        # when set spots are posted through this webhook
+        return str(self._get('WEBHOOK_URL', ''))
+
+    @property
+    def disable_spot_task(self) -> int:
+        # set to 1 when spots are posted by worker.py instead of the bot
+        return int(self._get('DISABLE_SPOT_TASK', '0'))
+
+    @property
+    def sources(self) -> list[str]:
+        # spot programs to poll. DISABLE_RBN=1 removes RBN from the list
+        sources = [x.strip().upper() for x in str(self._get('SOURCES', 'POTA,RBN')).split(',')]
+        if self.disable_rbn:
+            sources = [x for x in sources if x != 'RBN']
+        return sources
+
+    @property
+    def lease_db(self) -> str:
+        # shared SQLite file for the active/standby lease, unset = no lease
+        return str(self._get('LEASE_DB', ''))
+
+    @property
+    def lease_ttl(self) -> float:
+        return float(self._get('LEASE_TTL', '10'))
+
+    @property
+    def instance_name(self) -> str:
+        # must be different for each instance sharing a lease
+        return str(self._get('INSTANCE_NAME', f'{socket.gethostname()}-{os.getpid()}'))
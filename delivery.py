@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
+
+import aiohttp
+
+from clock import Clock
+
+if TYPE_CHECKING:
+    import discord
+
+log = logging.getLogger("discord")
+
+
+class Delivery(ABC):
+    '''
+    Where spot messages get posted. `embeds` are plain embed dicts in the
+    discord API format (see spots.test_msg).
+    '''
+
+    @abstractmethod
+    async def send(self, content: str, embeds: list[dict] = None):
+        pass
+
+    async def send_dm(self, user_id: int, content: str, embeds: list[dict] = None) -> bool:
+        '''
+        Send a direct message to a user. Returns False if it couldn't be sent
+        or the backend can't send DMs.
+        '''
+        return False
+
+    async def close(self):
+        pass
+
+
+class ChannelDelivery(Delivery):
+    '''
+    Posts through the bot's gateway connection to the configured channel.
+    discord is imported in the methods so the webhook worker doesn't need it.
+    '''
+
+    def __init__(self, client: 'discord.Client', cfg):
+        self.client = client
+        self.cfg = cfg
+
+    async def send(self, content: str, embeds: list[dict] = None):
+        import discord
+
+        channel = self.client.get_channel(self.cfg.channel_id)
+        embeds = [discord.Embed.from_dict(e) for e in embeds or []]
+        await channel.send(content=content, embeds=embeds)
+
+    async def send_dm(self, user_id: int, content: str, embeds: list[dict] = None) -> bool:
+        import discord
+
+        try:
+            user = self.client.get_user(user_id) or await self.client.fetch_user(user_id)
+            embeds = [discord.Embed.from_dict(e) for e in embeds or []]
+            await user.send(content=content, embeds=embeds)
+            return True
+        except discord.HTTPException as ex:
+            log.warning(f"could not DM user {user_id}: {ex}")
+            return False
+
+
+class WebhookDelivery(Delivery):
+    '''
+    Posts to a discord webhook URL over plain HTTP. No gateway connection is
+    needed so this can be used by a standalone spot worker. Webhooks can't
+    send DMs.
+
+    One HTTP session is kept open and reused for every post. Sends are done
+    one at a time and follow the rate limit headers discord returns, waiting
+    when the bucket is empty and retrying after a 429.
+    '''
+
+    MAX_TRIES = 5
+
+    def __init__(self, url: str, username: str = "MGRA Bot",
+                 session: aiohttp.ClientSession = None, clock: Clock = None):
+        self.url = url
+        self.clock = clock or Clock()
+        self.username = username
+        self._session = session
+        self._own_session = session is None
+        self._lock = asyncio.Lock()
+        self._remaining = None
+        self._reset_at = 0.0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+            self._own_session = True
+        return self._session
+
+    async def send(self, content: str, embeds: list[dict] = None):
+        payload = {
+            "content": content,
+            "embeds": embeds or [],
+            "username": self.username,
+            "allowed_mentions": {"parse": ["roles", "users", "everyone"]},
+        }
+
+        async with self._lock:
+            for _ in range(self.MAX_TRIES):
+                await self._wait_for_bucket()
+
+                session = self._get_session()
+                async with session.post(self.url, json=payload, params={"wait": "true"}) as response:
+                    self._update_bucket(response.headers)
+
+                    if response.status == 429:
+                        retry_after = await self._retry_after(response)
+                        log.warning(f"webhook rate limited, retrying in {retry_after:.2f}s")
+                        await self.clock.sleep(retry_after)
+                        continue
+
+                    if response.status >= 400:
+                        text = await response.text()
+                        log.error(f"error posting to webhook: {response.status} {text}")
+                    return
+
+            log.error("giving up posting to webhook after too many rate limits")
+
+    async def close(self):
+        if self._own_session and self._session is not None:
+            await self._session.close()
+        self._session = None
+
+    async def _wait_for_bucket(self):
+        if self._remaining == 0:
+            delay = self._reset_at - self.clock.monotonic()
+            if delay > 0:
+                await self.clock.sleep(delay)
+            self._remaining = None
+
+    def _update_bucket(self, headers):
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        try:
+            if remaining is not None:
+                self._remaining = int(remaining)
+            if reset_after is not None:
+                self._reset_at = self.clock.monotonic() + float(reset_after)
+        except ValueError:
+            self._remaining = None
+
+    async def _retry_after(self, response) -> float:
+        try:
+            j = await response.json()
+            return float(j['retry_after'])
+        except Exception:
+            pass
+        try:
+            return float(response.headers.get('Retry-After', 1))
+        except ValueError:
+            return 1.0
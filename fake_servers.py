@@ -0,0 +1,330 @@
+import asyncio
+import json
+import os
+import random
+from collections import deque
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+from clock import Clock
+
+# Local stand-ins for the POTA, RBN, SOTA, WWFF and discord webhook APIs used
+# by soak.py. Activity is generated up front from a seed so a run can be
+# repeated, and all times come from the (virtual) clock. Spot records are
+# copies of the recorded API responses in fixtures/ with the activity filled
+# in, so they keep the real field layout.
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+MODES = ['SSB', 'CW', 'FT8']
+BANDS_KHZ = {
+    'SSB': [3850, 7200, 14285, 18140, 21300],
+    'CW': [3550, 7032.5, 10112, 14025, 18080, 21030],
+    'FT8': [3573, 7074, 10136, 14074, 18100, 21074],
+}
+SKIMMERS = ['K4PRA', 'W3LPL', 'VE2WU', 'KM3T', 'NC7J', 'DK9IP', 'WZ7I', 'AC0C']
+
+
+def load_fixture(name: str):
+    '''A recorded API response ex: load_fixture('pota') -> fixtures/pota_spots.json'''
+    with open(os.path.join(FIXTURES, f'{name}_spots.json'), encoding='utf8') as f:
+        return json.load(f)
+
+
+class Activation:
+    def __init__(self, call: str, program: str, reference: str, mode: str,
+                 start: datetime, end: datetime, khz: float, qsy_khz: float = None):
+        self.call = call
+        self.program = program
+        self.reference = reference
+        self.mode = mode
+        self.start = start
+        self.end = end
+        self.khz = khz
+        self.qsy_khz = qsy_khz
+
+    def active(self, now: datetime) -> bool:
+        return self.start <= now < self.end
+
+    def freq(self, now: datetime) -> float:
+        if self.qsy_khz is not None and now >= self.start + (self.end - self.start) / 2:
+            return self.qsy_khz
+        return self.khz
+
+    def spot_time(self, now: datetime) -> datetime:
+        # re-spotted every 10 minutes while active
+        return now - timedelta(seconds=(now - self.start).total_seconds() % 600)
+
+    def comments(self, now: datetime) -> str:
+        if now >= self.end - timedelta(minutes=5):
+            return 'QRT thanks all'
+        return 'QRV'
+
+
+class FakeUpstreams:
+    '''
+    aiohttp app serving fake spot APIs and a fake discord webhook.
+
+    @param latency tuple: min/max real seconds added to every response
+    @param error_rate float: chance a spot API or webhook request gets a 429
+    @param rbn_version_change: time the RBN API starts returning a new ver_h
+    @param webhook_limit tuple: (posts, seconds) allowed per webhook bucket
+    '''
+
+    def __init__(self, clock: Clock, calls: list[str], start: datetime, days: float,
+                 background: int = 2000, seed: int = 1,
+                 latency: tuple[float, float] = (0.0, 0.002), error_rate: float = 0.01,
+                 rbn_version: str = '6fa56c', rbn_version_change: datetime = None,
+                 webhook_limit: tuple[int, float] = (5, 2.0)):
+        self.clock = clock
+        self.rand = random.Random(seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rbn_version = rbn_version
+        self.rbn_version_change = rbn_version_change
+        self.webhook_limit = webhook_limit
+
+        # first record of each fixture, copied for every fake spot
+        self.templates = {name: load_fixture(name)[0] for name in ('pota', 'sota', 'wwff')}
+        rbn = load_fixture('rbn')
+        self.templates['rbn'] = next(iter(rbn['spots'].values()))
+
+        self.activations = self._make_activations(calls, start, days)
+        self.background = self._make_background(background)
+
+        self.rbn_spots = deque()
+        self.rbn_last_id = 1000000
+        self.rbn_generated_to = start
+
+        self.bucket_reset = 0.0
+        self.bucket_used = 0
+
+        self.requests = {}
+        self.errors_served = 0
+        self.rate_limited = 0
+        self.posts = []
+        self._runner = None
+
+    def _make_activations(self, calls, start, days):
+        result = []
+        for day in range(int(days) + 1):
+            for call in calls:
+                if self.rand.random() > 0.4:
+                    continue
+                program = self.rand.choice(['POTA', 'POTA', 'POTA', 'SOTA', 'WWFF'])
+                mode = self.rand.choice(MODES)
+                begin = start + timedelta(days=day, minutes=self.rand.randrange(0, 24 * 60))
+                end = begin + timedelta(minutes=self.rand.randrange(30, 150))
+                khz = self.rand.choice(BANDS_KHZ[mode])
+                qsy = self.rand.choice(BANDS_KHZ[mode]) if self.rand.random() < 0.5 else None
+                if program == 'SOTA':
+                    ref = f'W4G/NG-{self.rand.randrange(1, 60):03}'
+                elif program == 'WWFF':
+                    ref = f'KFF-{self.rand.randrange(1, 5000):04}'
+                else:
+                    ref = f'US-{self.rand.randrange(1, 12000):04}'
+                result.append(Activation(call, program, ref, mode, begin, end, khz, qsy))
+        return result
+
+    def _make_background(self, count):
+        # untracked activators that fill up the POTA feed
+        spots = []
+        for i in range(count):
+            mode = self.rand.choice(MODES)
+            spots.append(json.dumps(dict(
+                self.templates['pota'],
+                spotId=50000000 + i,
+                activator=f"ZZ{i}XYZ",
+                frequency=str(self.rand.choice(BANDS_KHZ[mode])),
+                mode=mode,
+                reference=f"US-{i % 12000:04}",
+                spotTime="2024-01-01T00:00:00",
+                spotter="ZZ0ZZ",
+                comments="background")))
+        return ",".join(spots)
+
+    def active(self, program: str = None):
+        now = self.clock.now()
+        return [a for a in self.activations
+                if a.active(now) and (program is None or a.program == program)]
+
+    def expected_activations(self, until: datetime) -> int:
+        return sum(1 for a in self.activations if a.start < until)
+
+    async def _delay(self, name: str):
+        self.requests[name] = self.requests.get(name, 0) + 1
+        await asyncio.sleep(self.rand.uniform(*self.latency))
+
+    def _maybe_error(self):
+        if self.rand.random() < self.error_rate:
+            self.errors_served += 1
+            return web.json_response({"message": "slow down"}, status=429)
+        return None
+
+    async def pota_spots(self, request):
+        await self._delay('pota')
+        err = self._maybe_error()
+        if err is not None:
+            return err
+
+        now = self.clock.now()
+        items = []
+        for i, a in enumerate(self.active('POTA')):
+            items.append(json.dumps(dict(
+                self.templates['pota'],
+                spotId=40000000 + i,
+                activator=a.call,
+                frequency=str(a.freq(now)),
+                mode=a.mode,
+                reference=a.reference,
+                spotTime=a.spot_time(now).replace(tzinfo=None).isoformat(timespec='seconds'),
+                spotter=a.call,
+                comments=a.comments(now),
+                name="Fake Park")))
+        items.append(self.background)
+        return web.Response(text='[' + ','.join(x for x in items if x) + ']', content_type='application/json')
+
+    async def pota_stats(self, request):
+        await self._delay('stats')
+        call = request.match_info['call']
+        return web.json_response({
+            "callsign": call,
+            "name": f"Op {call}",
+            "qth": "GA",
+            "gravatar": "",
+            "activator": {"activations": 10, "parks": 5, "qsos": 500},
+            "attempts": {"activations": 11, "parks": 5, "qsos": 500},
+            "hunter": {"parks": 100, "qsos": 200},
+            "awards": 1,
+            "endorsements": 1
+        })
+
+    def _generate_rbn(self):
+        now = self.clock.now()
+        t = self.rbn_generated_to
+        while t + timedelta(minutes=1) <= now:
+            t += timedelta(minutes=1)
+            for a in self.activations:
+                if a.mode != 'CW' or not a.active(t):
+                    continue
+                for skimmer in self.rand.sample(SKIMMERS, self.rand.randrange(1, 5)):
+                    self.rbn_last_id += 1
+                    arr = list(self.templates['rbn'])
+                    arr[0] = skimmer
+                    arr[1] = a.freq(t) + self.rand.choice([-0.1, 0, 0.1])
+                    arr[2] = a.call
+                    arr[3] = self.rand.randrange(3, 35)
+                    arr[4] = self.rand.randrange(14, 28)
+                    arr[10] = int(t.timestamp())
+                    self.rbn_spots.append((self.rbn_last_id, arr))
+        self.rbn_generated_to = t
+
+        # only keep the last 10 minutes
+        cutoff = int((now - timedelta(minutes=10)).timestamp())
+        while self.rbn_spots and self.rbn_spots[0][1][10] < cutoff:
+            self.rbn_spots.popleft()
+
+    async def rbn_spots_php(self, request):
+        await self._delay('rbn')
+        err = self._maybe_error()
+        if err is not None:
+            return err
+
+        self._generate_rbn()
+        now = self.clock.now()
+        version = self.rbn_version
+        if self.rbn_version_change is not None and now >= self.rbn_version_change:
+            version = 'ffffff'
+
+        last_id = int(request.query.get('s', 0))
+        max_age = int(request.query.get('ma', 60))
+        rows = int(request.query.get('r', 100))
+        calls = set(request.query.get('cdx', '').split(','))
+        oldest = now.timestamp() - max_age
+
+        spots = {}
+        for spot_id, arr in self.rbn_spots:
+            if spot_id > last_id and arr[2] in calls and arr[10] >= oldest:
+                spots[str(spot_id)] = arr
+                if len(spots) >= rows:
+                    break
+        return web.json_response({"ver_h": version, "lastid_c": self.rbn_last_id, "spots": spots})
+
+    async def sota_spots(self, request):
+        await self._delay('sota')
+        now = self.clock.now()
+        return web.json_response([dict(
+            self.templates['sota'],
+            id=i,
+            timeStamp=a.spot_time(now).replace(tzinfo=None).isoformat(timespec='seconds'),
+            comments=a.comments(now),
+            callsign=a.call,
+            associationCode=a.reference.split('/')[0],
+            summitCode=a.reference.split('/')[1],
+            activatorCallsign=a.call + '/P',
+            frequency=str(a.freq(now) / 1000),
+            mode=a.mode.lower(),
+            summitDetails="Fake Summit, 1000m, 4 Points"
+        ) for i, a in enumerate(self.active('SOTA'))])
+
+    async def wwff_spots(self, request):
+        await self._delay('wwff')
+        now = self.clock.now()
+        return web.json_response([dict(
+            self.templates['wwff'],
+            id=i,
+            activator=a.call,
+            reference=a.reference,
+            reference_name="Fake Refuge",
+            frequency_khz=a.freq(now),
+            mode=a.mode,
+            remarks=a.comments(now),
+            spotter=a.call,
+            spot_time=int(a.spot_time(now).timestamp())
+        ) for i, a in enumerate(self.active('WWFF'))])
+
+    async def webhook(self, request):
+        await self._delay('webhook')
+        posts, per = self.webhook_limit
+        now = self.clock.monotonic()
+        if now >= self.bucket_reset:
+            self.bucket_reset = now + per
+            self.bucket_used = 0
+
+        # discord also returns the odd 429 before the bucket is empty
+        if self.bucket_used >= posts or self.rand.random() < self.error_rate:
+            self.rate_limited += 1
+            return web.json_response(
+                {"message": "You are being rate limited.", "retry_after": self.bucket_reset - now, "global": False},
+                status=429)
+
+        self.bucket_used += 1
+        self.posts.append((self.clock.now(), await request.json()))
+        headers = {
+            'X-RateLimit-Limit': str(posts),
+            'X-RateLimit-Remaining': str(posts - self.bucket_used),
+            'X-RateLimit-Reset-After': f'{self.bucket_reset - now:.3f}',
+        }
+        return web.json_response({"id": str(len(self.posts))}, headers=headers)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        '''Start the server and return its base URL'''
+        app = web.Application()
+        app.router.add_get('/pota/spot/activator', self.pota_spots)
+        app.router.add_get('/pota/stats/user/{call}', self.pota_stats)
+        app.router.add_get('/rbn/spots.php', self.rbn_spots_php)
+        app.router.add_get('/sota/spots', self.sota_spots)
+        app.router.add_get('/wwff/spots', self.wwff_spots)
+        app.router.add_post('/discord/webhooks/{id}/{token}', self.webhook)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://{host}:{port}'
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,56 @@
+import json
+import logging
+import re
+from typing import Callable
+
+log = logging.getLogger("discord")
+
+# the POTA spot feed is a flat array of flat objects. "activator" is always a
+# plain string so it can be found without decoding the rest of the spot.
+ACTIVATOR_RE = re.compile(r'"activator"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+_decoder = json.JSONDecoder()
+
+
+def filter_spots(data: bytes | str, match: Callable[[str], bool]) -> list:
+    '''
+    Decode only the spots in a POTA spot feed response whose activator passes
+    the `match` filter.
+
+    The activator field of every spot is located with a regex and checked
+    first. Only spots that match are fully decoded, the thousands of other
+    spots on a busy day are never turned into dicts.
+
+    Falls back to a full decode if the feed doesn't look like we expect.
+
+    @param data bytes|str: raw body from the POTA spot api
+    @param match Callable: filter called with the raw activator callsign
+    '''
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+
+    result = []
+    try:
+        for m in ACTIVATOR_RE.finditer(data):
+            act = m.group(1)
+            if '\\' in act:
+                act = json.loads(f'"{act}"')
+
+            if not match(act):
+                continue
+
+            # activator is the 2nd key (after the numeric spotId) so the
+            # start of this spot is the nearest '{' before it
+            start = data.rfind('{', 0, m.start())
+            if start < 0:
+                raise ValueError("spot object start not found")
+
+            spot, _ = _decoder.raw_decode(data, start)
+            if spot.get('activator') != act:
+                raise ValueError("decoded spot does not match activator")
+            result.append(spot)
+    except ValueError as ex:
+        log.warning(f"filtered decode of spot feed failed, using full decode: {ex}")
+        return [s for s in json.loads(data) if match(s.get('activator'))]
+
+    return result
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone, timedelta
+
+from spot import Spot
+
+log = logging.getLogger("discord")
+
+SCHEMA = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    """CREATE TABLE IF NOT EXISTS spots (
+        id INTEGER PRIMARY KEY,
+        ts INTEGER NOT NULL,
+        activator TEXT NOT NULL,
+        basecall TEXT NOT NULL,
+        source TEXT NOT NULL,
+        frequency REAL,
+        band TEXT,
+        mode TEXT,
+        reference TEXT,
+        snr INTEGER
+    )""",
+    "CREATE INDEX IF NOT EXISTS spots_call_ts ON spots (basecall, ts)",
+    "CREATE INDEX IF NOT EXISTS spots_ts ON spots (ts)",
+    # one row per day/call/source/band/mode. all /stats queries use this
+    """CREATE TABLE IF NOT EXISTS daily (
+        day TEXT NOT NULL,
+        basecall TEXT NOT NULL,
+        source TEXT NOT NULL,
+        band TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        spots INTEGER NOT NULL,
+        snr_sum INTEGER NOT NULL,
+        snr_count INTEGER NOT NULL,
+        snr_max INTEGER,
+        PRIMARY KEY (day, basecall, source, band, mode)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS daily_call_day ON daily (basecall, day)",
+]
+
+ROLLUP_SQL = """
+INSERT INTO daily (day, basecall, source, band, mode, spots, snr_sum, snr_count, snr_max)
+VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?)
+ON CONFLICT (day, basecall, source, band, mode) DO UPDATE SET
+    spots = spots + 1,
+    snr_sum = snr_sum + excluded.snr_sum,
+    snr_count = snr_count + excluded.snr_count,
+    snr_max = MAX(COALESCE(snr_max, excluded.snr_max), COALESCE(excluded.snr_max, snr_max))
+"""
+
+
+class SpotHistory:
+    '''
+    Append only store of every matched spot.
+
+    `record` only buffers the spot in memory, the buffer is written to
+    SQLite in one transaction by `flush` from a worker thread. Each write
+    also updates the daily rollup table the stats queries read from.
+    '''
+
+    # spots kept in memory while writes keep failing
+    MAX_PENDING = 10000
+
+    def __init__(self, path: str = "history.db"):
+        self.path = path
+        self._pending = []
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def record(self, spot: Spot):
+        t = spot.time
+        self._pending.append((
+            int(t.timestamp()),
+            t.strftime('%Y-%m-%d'),
+            spot.activator,
+            spot.basecall,
+            spot.program.value,
+            spot.hz / 1000,
+            spot.band,
+            spot.mode,
+            spot.reference,
+            spot.snr,
+        ))
+
+    async def flush(self) -> int:
+        '''Write all buffered spots. Returns the number of spots written.'''
+        if not self._pending:
+            return 0
+        rows, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception:
+            # keep the batch for the next flush (ex: database is locked)
+            self._pending = rows + self._pending
+            dropped = len(self._pending) - self.MAX_PENDING
+            if dropped > 0:
+                log.warning(f"history buffer full, dropping the {dropped} oldest spots")
+                del self._pending[:dropped]
+            raise
+        return len(rows)
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            for stmt in SCHEMA:
+                self._conn.execute(stmt)
+        return self._conn
+
+    def _write(self, rows):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO spots (ts, activator, basecall, source, frequency, band, mode, reference, snr) "
+                    "VALUES (?,?,?,?,?,?,?,?,?)",
+                    [(r[0], *r[2:]) for r in rows])
+                conn.executemany(
+                    ROLLUP_SQL,
+                    [(r[1], r[3], r[4], r[6], r[7],
+                      r[9] or 0, 0 if r[9] is None else 1, r[9]) for r in rows])
+
+    def _query(self, sql, args):
+        with self._lock:
+            return self._connect().execute(sql, args).fetchall()
+
+    async def top_activators(self, since: datetime, limit: int = 10):
+        '''(basecall, spots, active days) for POTA spots since the given day'''
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT basecall, SUM(spots), COUNT(DISTINCT day) FROM daily "
+            "WHERE day >= ? AND source = 'POTA' GROUP BY basecall "
+            "ORDER BY 2 DESC LIMIT ?",
+            (since.strftime('%Y-%m-%d'), limit))
+
+    async def band_mode_mix(self, since: datetime):
+        '''(band, mode, spots) for all spots since the given day'''
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT band, mode, SUM(spots) FROM daily WHERE day >= ? "
+            "GROUP BY band, mode ORDER BY 3 DESC",
+            (since.strftime('%Y-%m-%d'),))
+
+    async def snr_trend(self, basecall: str, days: int = 30):
+        '''(day, avg snr, best snr, reports) for RBN spots of a callsign'''
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT day, SUM(snr_sum) * 1.0 / SUM(snr_count), MAX(snr_max), SUM(snr_count) "
+            "FROM daily WHERE basecall = ? AND day >= ? AND source = 'RBN' "
+            "GROUP BY day HAVING SUM(snr_count) > 0 ORDER BY day",
+            (basecall, since.strftime('%Y-%m-%d')))
@@ -0,0 +1,135 @@
+import logging
+import sqlite3
+import threading
+
+from clock import Clock
+
+log = logging.getLogger("discord")
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS lease (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        holder TEXT NOT NULL,
+        expires REAL NOT NULL,
+        term INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        holder TEXT NOT NULL,
+        term INTEGER NOT NULL,
+        updated REAL NOT NULL,
+        data TEXT NOT NULL
+    )""",
+]
+
+
+class Lease:
+    '''
+    Leader lease shared by an active and a standby spot poller.
+
+    The lease lives in a SQLite file both instances can open (ex: a volume
+    shared by two containers). The holder renews it well before `ttl`
+    seconds run out. When it stops renewing, the other instance takes it
+    over and `term` goes up by one.
+
+    The holder also saves the poller state (posted spots and source
+    cursors) here so a new holder carries on where the old one stopped.
+    State is only written while the lease is still held, a holder that
+    lost the lease can't overwrite the new holder's state.
+    '''
+
+    def __init__(self, path: str, holder: str, ttl: float = 10, clock: Clock = None):
+        self.path = path
+        self.holder = holder
+        self.ttl = ttl
+        self.clock = clock or Clock()
+        self.term = 0
+        self._expires = 0.0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            # autocommit, transactions are started explicitly below
+            self._conn = sqlite3.connect(
+                self.path, timeout=self.ttl / 2, isolation_level=None, check_same_thread=False)
+            for stmt in SCHEMA:
+                self._conn.execute(stmt)
+        return self._conn
+
+    def is_held(self) -> bool:
+        '''True while this instance holds the lease. Does not touch the db.'''
+        return self.clock.now().timestamp() < self._expires
+
+    def acquire(self) -> bool:
+        '''
+        Renew the lease or take it over if it expired. Returns True if this
+        instance holds the lease afterwards.
+        '''
+        # taken before the write so the local expiry is never later than
+        # the one the other instance sees
+        now = self.clock.now().timestamp()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT holder, expires, term FROM lease WHERE id = 1").fetchone()
+                if row is not None and row[0] != self.holder and row[1] > now:
+                    conn.execute("COMMIT")
+                    self._expires = 0.0
+                    return False
+
+                if row is None:
+                    term = 1
+                elif row[0] == self.holder and row[2] == self.term:
+                    term = row[2]
+                else:
+                    term = row[2] + 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO lease (id, holder, expires, term) VALUES (1, ?, ?, ?)",
+                    (self.holder, now + self.ttl, term))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if term != self.term:
+            log.info(f"{self.holder} took the lease, term {term}")
+        self.term = term
+        self._expires = now + self.ttl
+        return True
+
+    def release(self):
+        '''Give up the lease so the standby takes over right away'''
+        with self._lock:
+            self._connect().execute(
+                "UPDATE lease SET expires = 0 WHERE id = 1 AND holder = ? AND term = ?",
+                (self.holder, self.term))
+        self._expires = 0.0
+
+    def save_state(self, data: str) -> bool:
+        '''Save the poller state. Returns False if the lease was lost.'''
+        now = self.clock.now().timestamp()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT holder, term FROM lease WHERE id = 1").fetchone()
+                if row is None or row[0] != self.holder or row[1] != self.term:
+                    conn.execute("COMMIT")
+                    self._expires = 0.0
+                    return False
+                conn.execute(
+                    "INSERT OR REPLACE INTO state (id, holder, term, updated, data) VALUES (1, ?, ?, ?, ?)",
+                    (self.holder, self.term, now, data))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def load_state(self) -> str | None:
+        '''The last state saved by any holder'''
+        with self._lock:
+            row = self._connect().execute("SELECT data FROM state WHERE id = 1").fetchone()
+        return row[0] if row else None
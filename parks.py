@@ -0,0 +1,148 @@
+import asyncio
+import csv
+import io
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger("discord")
+
+PARKS_CSV_URL = "https://pota.app/all_parks_ext.csv"
+
+
+def grid_to_latlon(grid: str) -> tuple[float, float] | None:
+    '''
+    Convert a 4 or 6 character maidenhead grid square to the lat/lon of its
+    center.
+    '''
+    if grid is None or len(grid) not in (4, 6):
+        return None
+
+    g = grid.upper()
+    try:
+        lon = (ord(g[0]) - ord('A')) * 20 - 180
+        lat = (ord(g[1]) - ord('A')) * 10 - 90
+        lon += int(g[2]) * 2
+        lat += int(g[3])
+        if len(g) == 6:
+            lon += (ord(g[4]) - ord('A')) * (2 / 24) + (1 / 24)
+            lat += (ord(g[5]) - ord('A')) * (1 / 24) + (1 / 48)
+        else:
+            lon += 1
+            lat += 0.5
+    except ValueError:
+        return None
+    return lat, lon
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    '''Great circle distance between two points in kilometers'''
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+class ParkIndex:
+    '''
+    Local index of every POTA park keyed by park reference.
+
+    Built from the POTA all parks CSV export and stored in a small SQLite
+    file. The file is only opened on the first lookup and is rebuilt in the
+    background by `refresh`.
+    '''
+
+    def __init__(self, path: str = "parks.db"):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def lookup(self, reference: str) -> dict | None:
+        '''
+        Return the park info for a reference or None if it's not known.
+        '''
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT reference, name, active, entity_id, location, latitude, longitude, grid "
+                "FROM parks WHERE reference = ?", (reference,)).fetchone()
+
+        if row is None:
+            return None
+        return {
+            'reference': row[0],
+            'name': row[1],
+            'active': row[2],
+            'entityId': row[3],
+            'locationDesc': row[4],
+            'latitude': row[5],
+            'longitude': row[6],
+            'grid': row[7],
+        }
+
+    def is_stale(self, max_age: float) -> bool:
+        try:
+            return (time.time() - os.path.getmtime(self.path)) > max_age
+        except OSError:
+            return True
+
+    async def refresh(self, session, url: str = PARKS_CSV_URL) -> bool:
+        '''
+        Download the all parks CSV and rebuild the index. The build runs in a
+        worker thread so the event loop isn't blocked.
+        '''
+        async with session.get(url) as response:
+            if response.status != 200:
+                log.error(f"error getting park list: {response.status}")
+                return False
+            text = await response.text(encoding='utf-8')
+
+        count = await asyncio.to_thread(self._build, text)
+        log.info(f"park index rebuilt with {count} parks")
+        return True
+
+    def _connect(self):
+        if self._conn is None:
+            if not os.path.exists(self.path):
+                return None
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        return self._conn
+
+    def _build(self, text: str) -> int:
+        tmp = self.path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+        reader = csv.DictReader(io.StringIO(text))
+        rows = (
+            (r['reference'], r['name'], int(r['active'] or 0),
+             int(r['entityId'] or 0), r['locationDesc'],
+             float(r['latitude'] or 0), float(r['longitude'] or 0), r['grid'])
+            for r in reader if r.get('reference'))
+
+        conn = sqlite3.connect(tmp)
+        try:
+            conn.execute(
+                "CREATE TABLE parks (reference TEXT PRIMARY KEY, name TEXT, "
+                "active INTEGER, entity_id INTEGER, location TEXT, "
+                "latitude REAL, longitude REAL, grid TEXT) WITHOUT ROWID")
+            conn.executemany("INSERT OR REPLACE INTO parks VALUES (?,?,?,?,?,?,?,?)", rows)
+            conn.commit()
+            count = conn.execute("SELECT COUNT(*) FROM parks").fetchone()[0]
+        finally:
+            conn.close()
+
+        # swap in the new file and make the next lookup reopen it
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            os.replace(tmp, self.path)
+        return count
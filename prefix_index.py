@@ -0,0 +1,80 @@
+import bisect
+import os
+
+
+class PrefixIndex:
+    '''
+    Sorted in-memory index of strings for fast, case insensitive prefix
+    searches. Used to answer slash command autocomplete without touching
+    the config files on every keystroke.
+    '''
+
+    def __init__(self):
+        self._keys = []
+        self._values = {}
+        self._mtime = None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, value: str):
+        key = value.casefold()
+        if key in self._values:
+            self._values[key] = value
+            return
+        bisect.insort(self._keys, key)
+        self._values[key] = value
+
+    def remove(self, value: str):
+        key = value.casefold()
+        if self._values.pop(key, None) is None:
+            return
+        i = bisect.bisect_left(self._keys, key)
+        del self._keys[i]
+
+    def replace(self, values: list[str]):
+        self._values = {v.casefold(): v for v in values if v}
+        self._keys = sorted(self._values)
+
+    def search(self, prefix: str, limit: int = 25) -> list[str]:
+        '''Return up to `limit` values starting with the given prefix'''
+        key = prefix.casefold()
+        i = bisect.bisect_left(self._keys, key)
+        result = []
+        while i < len(self._keys) and len(result) < limit:
+            k = self._keys[i]
+            if not k.startswith(key):
+                break
+            result.append(self._values[k])
+            i += 1
+        return result
+
+    def load_if_changed(self, path: str, loader) -> bool:
+        '''
+        Reload the index with `loader()` if the file at `path` was modified
+        since the last load. Only a stat() is done when nothing changed.
+        '''
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+
+        if mtime == self._mtime:
+            return False
+
+        values = loader()
+        if values is None:
+            return False
+        self.replace(values)
+        self._mtime = mtime
+        return True
+
+    def mark_current(self, path: str):
+        '''
+        Mark the file at `path` as already loaded. Call after writing a change
+        to the file that was also applied to the index with add/remove.
+        '''
+        try:
+            self._mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._mtime = None
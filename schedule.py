@@ -19,8 +19,19 @@ class Schedule:
     def messages(self):
         return self.data
 
-    def time_to_send_msg(self, msg) -> bool:
-        now = datetime.now(timezone.utc)
+    def get_msg(self, msg_name: str):
+        for msg in self.messages:
+            if (msg['name'] == msg_name):
+                return msg
+        return None
+
+    @property
+    def names(self) -> list[str]:
+        return [msg['name'] for msg in self.messages]
+
+    def time_to_send_msg(self, msg, now: datetime = None) -> bool:
+        if now is None:
+            now = datetime.now(timezone.utc)
         weekday = now.date().weekday()
 
         is_enabled = msg.get('enabled')
@@ -0,0 +1,183 @@
+import statistics
+from collections import OrderedDict
+
+from spot import Spot
+
+# Rolling summary of the RBN skimmer reports of each signal. RBN sends one
+# report per skimmer that hears a signal, these are combined into a count of
+# skimmers, best and median SNR and the regions they are in.
+
+# skimmer callsign prefix -> region. the longest matching prefix wins.
+# US and Canadian calls are split by call area, see get_region
+REGIONS = {
+    'KH': 'OC', 'VK': 'OC', 'ZL': 'OC', 'YB': 'OC', 'DU': 'OC',
+    'KL': 'NA West', 'KP': 'NA East', 'XE': 'NA Central',
+    'PY': 'SA', 'PP': 'SA', 'PU': 'SA', 'LU': 'SA', 'CE': 'SA', 'CX': 'SA', 'HK': 'SA',
+    'HC': 'SA', 'OA': 'SA', 'YV': 'SA', 'ZP': 'SA', 'CP': 'SA', '9Y': 'SA',
+    'ZS': 'AF', 'ZR': 'AF', '5Z': 'AF', '6W': 'AF', '7X': 'AF', 'CN': 'AF', 'SU': 'AF', 'EA8': 'AF',
+    'J': 'AS', '7K': 'AS', '7L': 'AS', '7M': 'AS', '7N': 'AS', '8J': 'AS', 'B': 'AS', 'HL': 'AS',
+    'DS': 'AS', 'VU': 'AS', '4X': 'AS', '4Z': 'AS', 'HS': 'AS', '9M': 'AS', '9V': 'AS', 'BV': 'AS',
+    'G': 'EU', 'M': 'EU', '2E': 'EU', 'F': 'EU', 'D': 'EU', 'I': 'EU', 'EA': 'EU', 'EB': 'EU',
+    'EC': 'EU', 'ON': 'EU', 'OO': 'EU', 'PA': 'EU', 'PD': 'EU', 'PE': 'EU', 'OH': 'EU',
+    'SM': 'EU', 'SA': 'EU', 'SE': 'EU', 'LA': 'EU', 'LB': 'EU', 'OZ': 'EU', 'OK': 'EU',
+    'OL': 'EU', 'OM': 'EU', 'SP': 'EU', 'SQ': 'EU', 'SO': 'EU', 'HA': 'EU', 'HG': 'EU',
+    'YO': 'EU', 'YU': 'EU', 'LZ': 'EU', 'S5': 'EU', '9A': 'EU', 'E7': 'EU', 'Z3': 'EU',
+    'OE': 'EU', 'HB': 'EU', 'LX': 'EU', 'EI': 'EU', 'CT': 'EU', 'SV': 'EU', 'UR': 'EU',
+    'UT': 'EU', 'US': 'EU', 'ES': 'EU', 'YL': 'EU', 'LY': 'EU', 'EW': 'EU', 'UA': 'EU',
+    'RA': 'EU', 'R': 'EU', 'TF': 'EU', 'OY': 'EU',
+}
+CALL_AREAS = {
+    '1': 'NA East', '2': 'NA East', '3': 'NA East', '4': 'NA East', '8': 'NA East',
+    '5': 'NA Central', '9': 'NA Central', '0': 'NA Central',
+    '6': 'NA West', '7': 'NA West',
+}
+CANADA_AREAS = {
+    '1': 'NA East', '2': 'NA East', '3': 'NA East', '9': 'NA East',
+    '4': 'NA Central', '5': 'NA Central',
+    '6': 'NA West', '7': 'NA West', '8': 'NA West', '0': 'NA West',
+}
+
+
+def get_region(skimmer: str) -> str:
+    '''
+    Rough region of a skimmer from its callsign ex: 'W3LPL-#' -> 'NA East'.
+    Returns '?' when it's not known.
+    '''
+    call = skimmer.split('-')[0].upper()
+    digits = [c for c in call[1:] if c.isdigit()]
+    if not digits:
+        return '?'
+    area = digits[0]
+
+    for n in (3, 2, 1):
+        region = REGIONS.get(call[:n])
+        if region is not None:
+            # asiatic russia
+            if region == 'EU' and call[0] in 'RU' and area in '890':
+                return 'AS'
+            return region
+
+    if call[0] in 'KNW' or call[:2] in ('AA', 'AB', 'AC', 'AD', 'AE', 'AF', 'AG', 'AI', 'AJ', 'AK'):
+        return CALL_AREAS.get(area, '?')
+    if call[:2] in ('VE', 'VA', 'VO', 'VY'):
+        return 'NA East' if call[:2] == 'VO' else CANADA_AREAS.get(area, '?')
+    return '?'
+
+
+class SkimmerSummary:
+    '''What the skimmers heard of one signal within the window'''
+
+    __slots__ = ('skimmers', 'best_snr', 'best_skimmer', 'median_snr', 'wpm', 'regions')
+
+    def __init__(self, skimmers: int, best_snr: int, best_skimmer: str,
+                 median_snr: float, wpm: float, regions: list[str]):
+        self.skimmers = skimmers
+        self.best_snr = best_snr
+        self.best_skimmer = best_skimmer
+        self.median_snr = median_snr
+        self.wpm = wpm
+        self.regions = regions
+
+
+class _Signal:
+    __slots__ = ('hz', 'reports')
+
+    def __init__(self, hz: int):
+        self.hz = hz
+        # skimmer -> [time, snr, wpm] of its latest report
+        self.reports = {}
+
+
+class SkimmerAggregator:
+    '''
+    Latest report of every skimmer for each signal, keyed by activator and
+    frequency. Reports within `tolerance` Hz are the same signal, skimmers
+    are often a few hundred Hz apart.
+
+    Memory is bounded. Only `max_activators` activators are kept (least
+    recently heard dropped first), `max_signals` frequencies per activator
+    and `max_skimmers` skimmers per signal. A skimmer that hears the same
+    signal again updates its report in place.
+    '''
+
+    def __init__(self, window: float = 10 * 60, tolerance: int = 500, max_activators: int = 500,
+                 max_signals: int = 4, max_skimmers: int = 100):
+        self.window = window
+        self.tolerance = tolerance
+        self.max_activators = max_activators
+        self.max_signals = max_signals
+        self.max_skimmers = max_skimmers
+        self._signals = OrderedDict()
+        self._latest = 0.0
+
+    def __len__(self):
+        return sum(len(s.reports) for sigs in self._signals.values() for s in sigs)
+
+    def _find(self, activator: str, hz: int) -> _Signal | None:
+        for sig in self._signals.get(activator, ()):
+            if abs(sig.hz - hz) <= self.tolerance:
+                return sig
+        return None
+
+    def add(self, spot: Spot):
+        t = spot.time.timestamp()
+        if t > self._latest:
+            self._latest = t
+
+        sigs = self._signals.get(spot.activator)
+        if sigs is None:
+            sigs = self._signals[spot.activator] = []
+            if len(self._signals) > self.max_activators:
+                self._signals.popitem(last=False)
+        else:
+            self._signals.move_to_end(spot.activator)
+
+        sig = self._find(spot.activator, spot.hz)
+        if sig is None:
+            if len(sigs) >= self.max_signals:
+                sigs.pop(0)
+            sig = _Signal(spot.hz)
+            sigs.append(sig)
+
+        report = sig.reports.get(spot.spotter)
+        if report is None:
+            if len(sig.reports) >= self.max_skimmers:
+                oldest = min(sig.reports, key=lambda k: sig.reports[k][0])
+                del sig.reports[oldest]
+            sig.reports[spot.spotter] = [t, spot.snr, spot.wpm]
+        elif t >= report[0]:
+            report[0] = t
+            report[1] = spot.snr
+            report[2] = spot.wpm
+
+    def expire(self):
+        '''Drop reports older than the window, counted from the newest report'''
+        cutoff = self._latest - self.window
+        for act in list(self._signals):
+            sigs = self._signals[act]
+            for sig in sigs:
+                for skimmer in [k for k, v in sig.reports.items() if v[0] < cutoff]:
+                    del sig.reports[skimmer]
+            sigs[:] = [sig for sig in sigs if sig.reports]
+            if not sigs:
+                del self._signals[act]
+
+    def summary(self, activator: str, hz: int) -> SkimmerSummary | None:
+        sig = self._find(activator, hz)
+        if sig is None:
+            return None
+
+        cutoff = self._latest - self.window
+        reports = [(v[1], k, v[2]) for k, v in sig.reports.items() if v[0] >= cutoff and v[1] is not None]
+        if not reports:
+            return None
+
+        best = max(reports)
+        wpms = [r[2] for r in reports if r[2] is not None]
+        return SkimmerSummary(
+            len(reports),
+            best[0],
+            best[1],
+            statistics.median(r[0] for r in reports),
+            statistics.median(wpms) if wpms else None,
+            sorted({get_region(r[1]) for r in reports} - {'?'}))
@@ -0,0 +1,459 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone, timedelta
+
+import aiohttp
+
+import sources
+import spots
+from clock import VirtualClock
+from config import Config
+from delivery import WebhookDelivery
+from fake_servers import FakeUpstreams
+from history import SpotHistory
+from lease import Lease
+from schedule import Schedule
+from spots import Poller
+from subscriptions import Subscriptions
+
+# Soak test. Runs the spot poller, history writer and scheduled messages
+# against the fake upstreams in fake_servers.py on a virtual clock, so days
+# of activity run in a few minutes. Prints memory, post and timing numbers
+# at the end and exits with 1 if a spot was posted twice or a scheduled
+# message was missed.
+#
+#   python3 soak.py --days 3
+
+log = logging.getLogger("discord")
+
+# memory is only counted for allocations made in these modules, so the fake
+# servers, the posts they keep and the soak's own numbers aren't included
+HERE = os.path.dirname(os.path.abspath(__file__))
+BOT_MODULES = ['spots.py', 'spot.py', 'sources.py', 'skimmers.py', 'history.py', 'delivery.py',
+               'subscriptions.py', 'parks.py', 'feed.py', 'lease.py']
+
+START = datetime(2024, 5, 6, tzinfo=timezone.utc)  # a monday
+RBN_VERSION = '6fa56c'
+LEASE_TTL = 10
+
+SCHEDULE = [
+    {
+        "name": "net",
+        "dow": 0,
+        "time_utc": "00:30",
+        "msg": ["Weekly net starts now"],
+        "embeds": [],
+        "enabled": 1,
+        "channel": "1"
+    },
+    {
+        "name": "disabled",
+        "dow": 1,
+        "time_utc": "12:00",
+        "msg": ["Never sent"],
+        "embeds": [],
+        "enabled": 0,
+        "channel": "1"
+    },
+    {
+        "name": "midweek",
+        "dow": 2,
+        "time_utc": "18:00",
+        "msg": ["Midweek reminder"],
+        "embeds": [{"title": "Reminder", "description": "QRV tonight"}],
+        "enabled": 1,
+        "channel": "1"
+    },
+]
+
+
+class LogCounter(logging.Handler):
+    '''Counts the log records of each level'''
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.counts = {}
+
+    def emit(self, record):
+        self.counts[record.levelname] = self.counts.get(record.levelname, 0) + 1
+
+
+class Killed(BaseException):
+    '''
+    Stops a poller in the middle of a tick, like its process died. Not an
+    Exception so the poller's own error handling doesn't catch it.
+    '''
+    pass
+
+
+class Loop:
+    '''One of the bot's background loops, run by `run` on the virtual clock'''
+
+    def __init__(self, seconds: float, func):
+        self.seconds = seconds
+        self.func = func
+        self.next_run = None
+
+
+async def run(clock: VirtualClock, end: datetime, loops: list[Loop]):
+    '''
+    Run the loops in order of when they are due until `end`. The clock jumps
+    straight to the next due loop. Rate limit waits move the clock forward
+    while a loop runs, like they take time in a real run.
+    '''
+    for loop in loops:
+        loop.next_run = clock.now()
+
+    while clock.now() < end:
+        loop = min(loops, key=lambda x: x.next_run)
+        if loop.next_run > clock.now():
+            clock.advance((loop.next_run - clock.now()).total_seconds())
+        try:
+            await loop.func()
+        except Exception as ex:
+            log.error(f"Error in {loop.func.__name__}", exc_info=ex)
+        loop.next_run = max(loop.next_run + timedelta(seconds=loop.seconds), clock.now())
+
+
+def bot_memory() -> int:
+    '''Bytes currently allocated by code in the bot modules'''
+    filters = [tracemalloc.Filter(True, os.path.join(HERE, name)) for name in BOT_MODULES]
+    snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+    return sum(stat.size for stat in snapshot.statistics('filename'))
+
+
+def duplicate_spot_posts(posts) -> int:
+    '''Number of spot posts whose whole payload was already posted'''
+    seen = set()
+    dups = 0
+    for _, payload in posts:
+        if not payload.get('embeds') or 'SPOT' not in payload['content']:
+            continue
+        key = json.dumps(payload, sort_keys=True)
+        if key in seen:
+            dups += 1
+        seen.add(key)
+    return dups
+
+
+def failover_time(fakes: FakeUpstreams, hour: float) -> datetime:
+    '''
+    Start of the first CW activation after `hour`, so the leader stops
+    while POTA and RBN spots of it are coming in
+    '''
+    after = START + timedelta(hours=hour)
+    acts = sorted((a for a in fakes.activations if a.start >= after), key=lambda a: a.start)
+    for a in acts:
+        if a.mode == 'CW':
+            return a.start
+    return acts[0].start if acts else after
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def write_files(calls: list[str]):
+    with open("callsigns.txt", "w") as f:
+        f.write("\n".join(calls) + "\n")
+    with open("schedule.json", "w", encoding='utf8') as f:
+        json.dump(SCHEDULE, f, indent=4)
+
+
+def expected_schedule_fires(end: datetime) -> int:
+    sched = Schedule(SCHEDULE)
+    t = START
+    count = 0
+    while t < end:
+        count += sum(1 for msg in sched.messages if sched.time_to_send_msg(msg, t))
+        t += timedelta(minutes=1)
+    return count
+
+
+async def soak(args):
+    clock = VirtualClock(START)
+    end = START + timedelta(days=args.days)
+    calls = [f"K{i}SOA" for i in range(args.calls)]
+    write_files(calls)
+
+    version_change = START + timedelta(hours=args.rbn_change_hour) if args.rbn_change_hour >= 0 else None
+    fakes = FakeUpstreams(
+        clock, calls, START, args.days,
+        background=args.background, seed=args.seed,
+        latency=(0, args.latency_ms / 1000), error_rate=args.error_rate,
+        rbn_version=RBN_VERSION, rbn_version_change=version_change)
+    base = await fakes.start()
+
+    os.environ.update({
+        'WEBHOOK_URL': f'{base}/discord/webhooks/1/token',
+        'PING_ROLE_ID': '1234',
+        'RBN_HDR': RBN_VERSION,
+        'SOURCES': 'POTA,RBN,SOTA,WWFF',
+        'HOME_GRID': 'EM84',
+    })
+    cfg = Config(required=Config.WORKER_REQUIRED)
+
+    spots.ACTIVATOR_INFO_URL = base + '/pota/stats/user/{call}'
+
+    subs = Subscriptions()
+    subs.add_call(1, calls[0])
+    subs.add_call(2, calls[1])
+    subs.set_bands(2, ['20m', '40m'])
+    subs.add_call(3, calls[2])
+    subs.set_delivery(3, 'dm')
+
+    history = SpotHistory()
+
+    def make_poller(name: str = None) -> Poller:
+        srcs = [
+            sources.PotaSource(base + '/pota/spot/activator'),
+            sources.RbnSource(base + '/rbn/spots.php'),
+            sources.SotaSource(base + '/sota/spots'),
+            sources.WwffSource(base + '/wwff/spots'),
+        ]
+        lease = Lease("lease.db", name, LEASE_TTL, clock) if name else None
+        return Poller(WebhookDelivery(cfg.webhook_url, clock=clock), cfg, history, subs, srcs, clock, lease)
+
+    # with --failover-hour an active and a standby poller share a lease. the
+    # active one is stopped right after its first post from then on, with
+    # the rest of that tick's spots not posted yet
+    if args.failover_hour >= 0:
+        pollers = [make_poller('a'), make_poller('b')]
+        kill_at = failover_time(fakes, args.failover_hour)
+    else:
+        pollers = [make_poller()]
+        kill_at = None
+    failover = {'at': kill_at}
+
+    def kill_after_post(poller: Poller):
+        rbn = next(src for src in poller.sources if src.program.value == 'RBN')
+        post = poller.post
+
+        async def post_then_die(content: str, embeds: list[dict] = None) -> bool:
+            sent = await post(content, embeds)
+            if sent and 'killed' not in failover and clock.now() >= kill_at:
+                failover['killed'] = clock.now()
+                failover['fetched_id'] = rbn.last_id
+                failover['tick_end_id'] = poller.source_state.get('RBN', {}).get('last_id')
+                raise Killed()
+            return sent
+        poller.post = post_then_die
+
+    tick_times = []
+    memory = []
+    schedule_fires = 0
+    header_fixed = False
+    dead = []
+
+    def active_poller() -> Poller | None:
+        return next((p for p in pollers if p not in dead and p.is_active()), None)
+
+    async with aiohttp.ClientSession() as session:
+        def poll_spots_of(poller: Poller):
+            async def poll_spots():
+                nonlocal header_fixed
+                if poller in dead:
+                    return
+                # an operator notices the RBN error and updates config.json
+                fix_at = version_change + timedelta(hours=args.rbn_fix_hours) if version_change else None
+                if fix_at is not None and not header_fixed and clock.now() >= fix_at:
+                    with open("config.json", "w") as f:
+                        json.dump({"RBN_HDR": "ffffff"}, f)
+                    header_fixed = True
+
+                cfg.reload_if_changed()
+                if not poller.is_active():
+                    return
+                start = time.perf_counter()
+                try:
+                    await poller.tick(session)
+                except Killed:
+                    log.info(f"{poller.lease.holder} stopped in the middle of a tick")
+                    dead.append(poller)
+                    return
+                tick_times.append(time.perf_counter() - start)
+            return poll_spots
+
+        def check_lease_of(poller: Poller):
+            async def check_lease():
+                if poller in dead:
+                    return
+                was_leader = poller.leader
+                await poller.check_lease(session)
+                if poller.leader and not was_leader and 'killed' in failover and 'took_over' not in failover:
+                    rbn = next(src for src in poller.sources if src.program.value == 'RBN')
+                    failover['took_over'] = clock.now()
+                    failover['handed_id'] = rbn.last_id
+            return check_lease
+
+        async def flush_history():
+            await history.flush()
+
+        async def check_scheduled_msgs():
+            nonlocal schedule_fires
+            # only the active instance sends, like in bot.py
+            poller = active_poller()
+            if poller is None:
+                return
+            schedule = Schedule.get_schedule()
+            now = clock.now()
+            for x in schedule.messages:
+                if schedule.time_to_send_msg(x, now):
+                    content, _ = Schedule.get_scheduled_msg(x)
+                    await poller.delivery.send(content, x['embeds'])
+                    schedule_fires += 1
+
+        async def sample_memory():
+            memory.append(bot_memory())
+
+        loops = []
+        for poller in pollers:
+            if poller.lease is not None:
+                loops.append(Loop(LEASE_TTL / 3, check_lease_of(poller)))
+                kill_after_post(poller)
+            loops.append(Loop(15, poll_spots_of(poller)))
+        loops += [
+            Loop(15, flush_history),
+            Loop(60, check_scheduled_msgs),
+            Loop(60 * 60, sample_memory),
+        ]
+
+        tracemalloc.start()
+        wall_start = time.perf_counter()
+        try:
+            await run(clock, end, loops)
+        finally:
+            await history.flush()
+            for poller in pollers:
+                await poller.delivery.close()
+            await fakes.stop()
+        wall = time.perf_counter() - wall_start
+        tracemalloc.stop()
+
+    return {
+        'clock': clock,
+        'end': end,
+        'fakes': fakes,
+        'poller': active_poller() or pollers[-1],
+        'failover': failover,
+        'history': history,
+        'tick_times': tick_times,
+        'memory': memory,
+        'wall': wall,
+        'schedule_fires': schedule_fires,
+    }
+
+
+def report(result, logs: LogCounter) -> bool:
+    '''Print the results. Returns False if the run failed.'''
+    fakes = result['fakes']
+    ticks = result['tick_times']
+    memory = result['memory']
+    sim = result['clock'].now() - START
+
+    posts = {}
+    errors = 0
+    for _, payload in fakes.posts:
+        content = payload['content']
+        if 'VERSION MISMATCH' in content:
+            errors += 1
+        elif content.endswith('SPOT') or ' SPOT ' in content:
+            program = content.split()[1]
+            posts[program] = posts.get(program, 0) + 1
+
+    dups = duplicate_spot_posts(fakes.posts)
+    expected_fires = expected_schedule_fires(result['end'])
+    rows = result['history']._query("SELECT source, COUNT(*) FROM spots GROUP BY source", ())
+
+    def kb(n):
+        return f'{n / 1024:.0f} kB'
+
+    print(f"simulated {sim} in {result['wall']:.1f}s ({sim.total_seconds() / result['wall']:.0f}x)")
+    print(f"activations: {fakes.expected_activations(result['end'])}")
+    print(f"spot posts: {', '.join(f'{k} {v}' for k, v in sorted(posts.items()))}")
+    print(f"error posts: {errors}")
+    print(f"duplicate spot posts: {dups}")
+    print(f"scheduled msgs: {result['schedule_fires']} sent, {expected_fires} expected")
+    print(f"webhook 429s: {fakes.rate_limited}, upstream errors served: {fakes.errors_served}")
+    print(f"upstream requests: {', '.join(f'{k} {v}' for k, v in sorted(fakes.requests.items()))}")
+    print(f"history rows: {', '.join(f'{k} {v}' for k, v in rows)}")
+    print(f"storage: {len(result['poller'].storage.spots)} spots at end")
+    for src in result['poller'].sources:
+        if src.program.value == 'RBN':
+            print(f"skimmers: {len(src.skimmers)} reports held at end")
+    print(f"ticks: {len(ticks)}, mean {statistics.mean(ticks) * 1000:.1f} ms, "
+          f"p95 {percentile(ticks, 0.95) * 1000:.1f} ms, max {max(ticks) * 1000:.1f} ms")
+    if memory:
+        print(f"bot memory: first hour {kb(memory[0])}, last hour {kb(memory[-1])}, max {kb(max(memory))}")
+    print(f"log: {', '.join(f'{k} {v}' for k, v in sorted(logs.counts.items())) or 'no warnings'}")
+
+    ok = True
+    failover = result['failover']
+    if failover['at'] is not None:
+        if 'took_over' not in failover:
+            print(f"FAIL: the standby never took over (leader stop planned at {failover['at']})")
+            ok = False
+        else:
+            print(f"failover: leader stopped at {failover['killed']} with RBN fetched to {failover['fetched_id']}, "
+                  f"standby took over at {failover['took_over']} from RBN {failover['handed_id']}")
+            # not all spots of the unfinished tick were posted, the standby
+            # must fetch them again
+            if failover['handed_id'] != failover['tick_end_id']:
+                print(f"FAIL: standby got RBN cursor {failover['handed_id']}, "
+                      f"the end of the last full tick was {failover['tick_end_id']}")
+                ok = False
+    if dups:
+        print("FAIL: spots were posted more than once")
+        ok = False
+    if result['schedule_fires'] != expected_fires:
+        print("FAIL: scheduled messages sent don't match the schedule")
+        ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test the spot poller against fake upstream APIs")
+    parser.add_argument('--days', type=float, default=3, help="simulated days to run")
+    parser.add_argument('--calls', type=int, default=40, help="tracked callsigns")
+    parser.add_argument('--background', type=int, default=2000, help="untracked spots in the POTA feed")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-ms', type=float, default=2, help="max latency added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.01, help="chance of a 429 from POTA and RBN")
+    parser.add_argument('--rbn-change-hour', type=float, default=30,
+                        help="sim hour the RBN version header changes, -1 for never")
+    parser.add_argument('--rbn-fix-hours', type=float, default=2,
+                        help="hours until RBN_HDR is updated after the change")
+    parser.add_argument('--failover-hour', type=float, default=-1,
+                        help="run an active and a standby poller and stop the active one during an "
+                             "activation after this sim hour, -1 for a single poller")
+    parser.add_argument('--verbose', action='store_true', help="print the bot's log")
+    args = parser.parse_args()
+
+    logs = LogCounter()
+    log.addHandler(logs)
+    log.setLevel(logging.INFO)
+    if args.verbose:
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    else:
+        log.propagate = False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        result = asyncio.run(soak(args))
+        ok = report(result, logs)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
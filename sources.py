@@ -0,0 +1,266 @@
+import logging
+import urllib.parse
+from abc import ABC, abstractmethod
+
+from feed import filter_spots
+from skimmers import SkimmerAggregator
+from spot import Program, Spot, get_basecall, parse_khz, parse_time
+
+# Spot sources. Each source fetches spots from one program's API and returns
+# them as Spot objects. Raw API data is parsed here and nowhere else.
+
+log = logging.getLogger("discord")
+
+POTA_SPOT_URL = "https://api.pota.app/spot/activator"
+RBN_SPOT_URL = "https://www.reversebeacon.net/spots.php"
+SOTA_SPOT_URL = "https://api2.sota.org.uk/api/spots/-1/all"
+WWFF_SPOT_URL = "https://spots.wwff.co/static/spots.json"
+
+
+class SourceError(Exception):
+    '''A source problem that should be reported in the spot channel'''
+    pass
+
+
+class SpotSource(ABC):
+    '''
+    Base class of a spot source. `fetch` is called by the poller about
+    once every `interval` seconds.
+
+    The poller ticks every 15 s and ticks start a few ms late now and then.
+    A source is due `slack` seconds early so a fetch that was a bit late
+    doesn't push the next one back by a whole tick.
+    '''
+
+    program = None
+    interval = 60
+    slack = 7.5
+
+    def __init__(self, url: str):
+        self.url = url
+        self.last_fetch = None
+
+    def is_due(self, now: float) -> bool:
+        return self.last_fetch is None or (now - self.last_fetch) >= self.interval - self.slack
+
+    def save_state(self) -> dict:
+        '''Anything a standby poller needs to carry on from this source'''
+        return {}
+
+    def load_state(self, state: dict):
+        pass
+
+    @abstractmethod
+    async def fetch(self, session, calls: set[str], cfg) -> list[Spot]:
+        '''
+        Return the spots of the tracked callsigns.
+
+        @param calls set: tracked base callsigns
+        '''
+
+    @abstractmethod
+    def parse(self, raw) -> Spot:
+        '''Build a Spot from one raw API record'''
+
+    def parse_all(self, records) -> list[Spot]:
+        result = []
+        for raw in records:
+            try:
+                result.append(self.parse(raw))
+            except (KeyError, TypeError, ValueError) as ex:
+                log.warning(f"skipping bad {self.program.value} spot {raw}: {ex}")
+        return result
+
+    async def _get_json(self, session, url=None, params=None):
+        async with session.get(url or self.url, params=params) as response:
+            if response.status == 200:
+                return await response.json(content_type=None)
+            log.error(f"error getting spots from {self.program.value}: {response.status}")
+            return None
+
+
+class PotaSource(SpotSource):
+    program = Program.POTA
+
+    def __init__(self, url: str = POTA_SPOT_URL):
+        super().__init__(url)
+
+    async def fetch(self, session, calls, cfg):
+        async with session.get(self.url) as response:
+            if response.status != 200:
+                log.error(f"error getting spots from POTA: {response.status}")
+                return []
+            body = await response.read()
+
+        return self.parse_all(
+            filter_spots(body, lambda act: get_basecall(act) in calls))
+
+    def parse(self, raw) -> Spot:
+        return Spot(
+            self.program,
+            raw['activator'],
+            parse_khz(raw['frequency']),
+            str(raw['mode']),
+            parse_time(raw['spotTime']),
+            reference=raw['reference'],
+            name=raw['name'] or '',
+            location=raw['locationDesc'] or '',
+            comments=str(raw['comments'] or ''),
+            spotter=raw.get('spotter') or '')
+
+
+class RbnSource(SpotSource):
+    '''
+    Reverse Beacon Network CW spots. Only spots newer than `last_id` are
+    returned by the API. Every skimmer report goes into `skimmers`, only the
+    newest spot per activator is returned.
+    '''
+
+    program = Program.RBN
+
+    # the API returns at most 100 rows, more are fetched while pages are full
+    MAX_PAGES = 5
+
+    def __init__(self, url: str = RBN_SPOT_URL):
+        super().__init__(url)
+        self.last_id = 0
+        self.skimmers = SkimmerAggregator()
+
+    def save_state(self):
+        return {'last_id': self.last_id}
+
+    def load_state(self, state):
+        self.last_id = state.get('last_id', 0)
+
+    async def fetch(self, session, calls, cfg):
+        # h = returned as "ver_h": "2aa296" (version header)
+        # ma = max age in seconds. last_id keeps spots from repeating so
+        #      allow a late fetch too
+        # m = 1 (CW)
+        # bc = 1 (CQ)
+        # s = last_id
+        # r = max rows (100 is highest)
+        # cdx = callsign to look for
+
+        # expected hdr comes from the RBN_HDR config value
+        expected_ver = cfg.rbn_api_hdr  # '2aa296'
+
+        calls = [urllib.parse.quote(call) for call in sorted(calls)]
+
+        spots = {}
+        for _ in range(self.MAX_PAGES):
+            url = f'{self.url}?h={expected_ver}&ma={self.interval + 30}&m=1&bc=1&s={self.last_id}&r=100&cdx={",".join(calls)}'
+
+            j = await self._get_json(session, url)
+            if j is None:
+                self.last_id = 0
+                break
+
+            ver = j.get('ver_h')
+            if ver != expected_ver:
+                log.warning(f'RBN API Version mismatch! Expected {expected_ver} but got {ver}')
+                self.last_id = 0
+                raise SourceError('Error RBN VERSION MISMATCH')
+
+            raw_spots = j.get('spots', {})
+            ids = sorted(raw_spots, key=int)
+            for spot in self.parse_all(raw_spots[x] for x in ids):
+                self.skimmers.add(spot)
+                spots[spot.activator] = spot
+
+            if len(ids) < 100:
+                self.last_id = max(j.get('lastid_c'), self.last_id, *(int(x) for x in ids))
+                break
+            # full page, there may be more after the last one returned
+            self.last_id = max(self.last_id, int(ids[-1]))
+
+        self.skimmers.expire()
+        return list(spots.values())
+
+    def parse(self, arr) -> Spot:
+        return Spot(
+            self.program,
+            arr[2],
+            parse_khz(arr[1]),
+            'CW',         # URL only gets CW spots
+            parse_time(arr[10]),
+            spotter=arr[0],
+            snr=int(arr[3]),
+            wpm=int(arr[4]))
+
+
+class SotaSource(SpotSource):
+    '''Summits on the air spots from the last hour'''
+
+    program = Program.SOTA
+    interval = 120
+
+    def __init__(self, url: str = SOTA_SPOT_URL):
+        super().__init__(url)
+
+    async def fetch(self, session, calls, cfg):
+        j = await self._get_json(session)
+        if not j:
+            return []
+
+        return self.parse_all(
+            s for s in j
+            if get_basecall((s.get('activatorCallsign') or '').strip().upper()) in calls)
+
+    def parse(self, raw) -> Spot:
+        return Spot(
+            self.program,
+            raw['activatorCallsign'].strip().upper(),
+            # SOTA frequencies are in MHz
+            parse_khz(float(raw['frequency']) * 1000),
+            str(raw.get('mode') or ''),
+            parse_time(raw['timeStamp']),
+            reference=f"{raw.get('associationCode', '')}/{raw.get('summitCode', '')}",
+            name=raw.get('summitDetails') or '',
+            location=raw.get('associationCode') or '',
+            comments=raw.get('comments') or '',
+            spotter=raw.get('callsign') or '')
+
+
+class WwffSource(SpotSource):
+    '''World Wide Flora and Fauna spots'''
+
+    program = Program.WWFF
+    interval = 120
+
+    def __init__(self, url: str = WWFF_SPOT_URL):
+        super().__init__(url)
+
+    async def fetch(self, session, calls, cfg):
+        j = await self._get_json(session)
+        if not j:
+            return []
+
+        return self.parse_all(
+            s for s in j
+            if get_basecall((s.get('activator') or '').strip().upper()) in calls)
+
+    def parse(self, raw) -> Spot:
+        return Spot(
+            self.program,
+            raw['activator'].strip().upper(),
+            parse_khz(raw['frequency_khz']),
+            str(raw.get('mode') or ''),
+            parse_time(raw['spot_time']),
+            reference=raw.get('reference', ''),
+            name=raw.get('reference_name') or '',
+            comments=raw.get('remarks') or '',
+            spotter=raw.get('spotter') or '')
+
+
+SOURCES = {
+    Program.POTA: PotaSource,
+    Program.RBN: RbnSource,
+    Program.SOTA: SotaSource,
+    Program.WWFF: WwffSource,
+}
+
+
+def make_sources() -> list[SpotSource]:
+    '''One instance of every known source'''
+    return [cls() for cls in SOURCES.values()]
@@ -0,0 +1,136 @@
+import enum
+import re
+from datetime import datetime, timezone
+
+from bands import get_band
+
+
+class Program(enum.Enum):
+    POTA = 'POTA'
+    RBN = 'RBN'
+    SOTA = 'SOTA'
+    WWFF = 'WWFF'
+
+
+def get_basecall(callsign: str) -> str:
+    '''
+    Get the base component of a given callsign (ie. the callsign without '/P'
+    suffixes or country prefixes ie 'W4/').
+    '''
+    if callsign is None:
+        return ""
+
+    if "/" in callsign:
+        basecall = max(
+            callsign.split("/")[0],
+            callsign.split("/")[1],
+            key=len)
+    else:
+        basecall = callsign
+    return basecall
+
+
+def validate_call(callsign: str) -> bool:
+    '''
+    Validates a callsign.
+
+    The format should be pretty normal US amateur radio callsign.
+    '''
+    base = get_basecall(callsign)
+    pattern = r'\d?[a-zA-Z]{1,2}\d{1,4}[a-zA-Z]{1,4}'
+    m = re.match(pattern, base)
+
+    if m:
+        return True
+    return False
+
+
+def parse_time(value) -> datetime:
+    '''
+    Spot time as an aware UTC datetime. Accepts epoch seconds or an ISO
+    string, naive ISO strings are UTC.
+    '''
+    if isinstance(value, datetime):
+        t = value
+    elif isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    else:
+        t = datetime.fromisoformat(value)
+
+    if t.tzinfo is None:
+        return t.replace(tzinfo=timezone.utc)
+    return t.astimezone(timezone.utc)
+
+
+def parse_khz(value) -> int:
+    '''Frequency in kHz (as a number or string) to whole Hz'''
+    return round(float(value) * 1000)
+
+
+class Spot:
+    '''
+    A spot from any source. Built once by the source that fetched it, every
+    value is already parsed so nothing downstream converts it again.
+
+    `hz` is the frequency in whole Hz. RBN reports fractions of a kHz and
+    the QSY check in Storage works on 0.2 kHz steps.
+    '''
+
+    __slots__ = (
+        'program', 'activator', 'basecall', 'hz', 'band', 'mode', 'time',
+        'reference', 'name', 'location', 'comments', 'spotter', 'snr', 'wpm')
+
+    def __init__(self, program: Program, activator: str, hz: int, mode: str,
+                 time: datetime, reference: str = '', name: str = '',
+                 location: str = '', comments: str = '', spotter: str = '',
+                 snr: int = None, wpm: int = None):
+        self.program = program
+        self.activator = activator
+        self.basecall = get_basecall(activator)
+        self.hz = hz
+        self.band = get_band(hz / 1000)
+        self.mode = mode.upper()
+        self.time = time
+        self.reference = reference
+        self.name = name
+        self.location = location
+        self.comments = comments
+        self.spotter = spotter
+        self.snr = snr
+        self.wpm = wpm
+
+    @property
+    def khz(self) -> str:
+        '''Frequency in kHz for display ex: 14285 or 7032.5'''
+        return f'{self.hz / 1000:.3f}'.rstrip('0').rstrip('.')
+
+    @property
+    def time_str(self) -> str:
+        return self.time.strftime('%Y-%m-%d %H:%M')
+
+    def to_dict(self) -> dict:
+        '''Plain JSON values, the reverse of `from_dict`'''
+        return {
+            'program': self.program.value,
+            'activator': self.activator,
+            'hz': self.hz,
+            'mode': self.mode,
+            'time': self.time.isoformat(),
+            'reference': self.reference,
+            'name': self.name,
+            'location': self.location,
+            'comments': self.comments,
+            'spotter': self.spotter,
+            'snr': self.snr,
+            'wpm': self.wpm,
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> 'Spot':
+        return Spot(
+            Program(d['program']), d['activator'], d['hz'], d['mode'], parse_time(d['time']),
+            reference=d['reference'], name=d['name'], location=d['location'],
+            comments=d['comments'], spotter=d['spotter'], snr=d['snr'], wpm=d['wpm'])
+
+    def __repr__(self):
+        return f'<Spot {self.program.value} {self.activator} {self.khz} {self.mode} {self.time_str}>'
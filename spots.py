@@ -0,0 +1,595 @@
+import asyncio
+import json
+import logging
+from datetime import timedelta
+
+from cache import AsyncTTL
+
+from clock import Clock
+from delivery import Delivery
+from history import SpotHistory
+from lease import Lease
+from parks import ParkIndex, distance_km, grid_to_latlon
+from skimmers import SkimmerSummary
+from sources import SourceError, SpotSource, make_sources
+from spot import Program, Spot, get_basecall, parse_time
+from subscriptions import Subscriptions
+
+# Spot fetching, formatting and de-duplication. Kept apart from bot.py so the
+# spot poller can run without a discord gateway connection (see worker.py)
+
+log = logging.getLogger("discord")
+
+mutex_lock = asyncio.Lock()
+
+ACTIVATOR_INFO_URL = "https://api.pota.app/stats/user/{call}"
+
+# discord's limit on message content length
+MAX_CONTENT = 2000
+
+park_index = ParkIndex()
+
+test_msg = {
+    "content": "",
+    "tts": False,
+    "embeds": [
+        {
+            "title": "N7OOS - - - *US-11254*  - - -  (SSB on 14285 MHz)",
+            "description": "2024-01-01 14:50 • park • profile • qrz",
+            "color": 2326507,
+            "fields": [
+                {
+                    "name": "Activator",
+                    "value": "Jim Vaughn"
+                },
+                {
+                    "name": "Location",
+                    "value": "US-FL",
+                    "inline": False
+                },
+                {
+                    "name": "Comments",
+                    "value": "",
+                    "inline": False
+                }
+            ],
+            "thumbnail": {
+                "url": ""
+            }
+        }
+    ],
+    "components": [],
+    "actions": {},
+    "username": "MGRA Bot"
+}
+
+rbn_msg = {
+    "content": "",
+    "tts": False,
+    "embeds": [
+        {
+            "title": "",
+            "description": "",
+            "color": 8383267,
+            "fields": [
+                {
+                    "name": "Type",
+                    "value": "RBN"
+                },
+                {
+                    "name": "Spotted By",
+                    "value": ""
+                },
+            ],
+        }
+    ],
+    "components": [],
+    "actions": {},
+    "username": "MGRA Bot"
+}
+
+program_msg = {
+    "content": "",
+    "tts": False,
+    "embeds": [
+        {
+            "title": "",
+            "description": "",
+            "color": 15105570,
+            "fields": [
+                {
+                    "name": "Type",
+                    "value": ""
+                },
+                {
+                    "name": "Location",
+                    "value": "",
+                    "inline": False
+                },
+                {
+                    "name": "Comments",
+                    "value": "",
+                    "inline": False
+                }
+            ],
+        }
+    ],
+    "components": [],
+    "actions": {},
+    "username": "MGRA Bot"
+}
+
+
+@AsyncTTL(time_to_live=6 * 60 * 60, skip_args=1)  # 6hours
+async def get_activator_stats(session, activator: str):
+    '''Return all spot + comments from a given activation'''
+    s = get_basecall(activator)
+
+    url = ACTIVATOR_INFO_URL.format(call=s)
+    async with session.get(url) as response:
+        if response.status == 200:
+            return await response.json()
+        else:
+            return None
+
+
+async def get_callsign_list() -> list[str]:
+    async with mutex_lock:
+        return _get_callsign_list()
+
+
+def _get_callsign_list() -> list[str]:
+    with open(file="callsigns.txt", mode="r") as f:
+        lines = f.readlines()
+
+    return [s.strip() for s in lines]
+
+
+async def build_pota_embed(session, spot: Spot, home_grid: str = '') -> str:
+    '''
+    The bulk of the work is done here to format spot data into a nice looking
+    discord embed
+
+    @param spot Spot: a spot from the pota api
+    @param home_grid str: optional grid square to show the distance from
+    '''
+    def get_title(act, ref, mode, freq):
+        return f"{act} — *{reference}*  —  {freq} ({mode})"
+
+    def get_act_title(name, actx, qsos):
+        return f"_{name}_   ( **{actx}** actx / **{qsos}** qs )"
+
+    def get_park_info(ref):
+        park = park_index.lookup(ref)
+        if park is None or not park['grid']:
+            return ""
+        info = f"\n{park['grid']}"
+        home = grid_to_latlon(home_grid)
+        if home is not None:
+            dist = distance_km(home[0], home[1], park['latitude'], park['longitude'])
+            info += f" • {dist:.0f} km"
+        return info
+
+    def get_gravatar(id):
+        return f"https://gravatar.com/avatar/{id}?d=identicon"
+
+    def get_description(ref, call, timestamp):
+        park_url = f"https://pota.app/#/park/{ref}"
+        act_url = f"https://pota.app/#/profile/{get_basecall(call)}"
+        qrz_url = f"https://www.qrz.com/db/{call}"
+        return f"{timestamp} • [park]({park_url}) • [profile]({act_url}) • [qrz]({qrz_url})"
+
+    act = spot.activator
+    freq = spot.khz
+    mode = spot.mode
+    reference = spot.reference
+    park_name = spot.name
+    locations = spot.location
+    timestamp = spot.time_str
+
+    test_msg["embeds"][0]['title'] = get_title(act, reference, mode, freq)
+    test_msg["embeds"][0]['description'] = get_description(reference, act, timestamp)
+
+    act_info = await get_activator_stats(session, act)
+    act_info_unknown = {
+        "callsign": "unknown",
+        "name": "unknown",
+        "qth": "unknown",
+        "gravatar": "",
+        "activator": {
+            "activations": '?',
+            "parks": '?',
+            "qsos": '?'
+        },
+        "attempts": {
+            "activations": '?',
+            "parks": '?',
+            "qsos": '?'
+        },
+        "hunter": {
+            "parks": '?',
+            "qsos": '?'
+        },
+        "awards": '?',
+        "endorsements": '?'
+    }
+    if act_info is None:
+        act_info = act_info_unknown
+
+    actx = act_info['activator']['activations']
+    qsos = act_info['activator']['qsos']
+    name = act_info['name']
+    gravatar_id = act_info['gravatar']
+    test_msg["embeds"][0]['thumbnail']['url'] = get_gravatar(gravatar_id)
+
+    test_msg["embeds"][0]['fields'][0]['value'] = get_act_title(
+        name, actx, qsos)
+    test_msg["embeds"][0]['fields'][1]['value'] = f"{park_name}\n{locations}{get_park_info(reference)}"
+    test_msg["embeds"][0]['fields'][2]['value'] = spot.comments
+
+    return test_msg
+
+
+def build_rbn_embed(spot: Spot, summary: SkimmerSummary = None) -> str:
+    '''
+    The bulk of the work is done here to format spot data into a nice looking
+    discord embed
+
+    @param spot Spot: a spot from the rbn api
+    @param summary SkimmerSummary: optional summary of all skimmers that
+        heard the signal, shown instead of the single spot's skimmer
+    '''
+    def get_title(act, mode, freq):
+        return f"{act} —  {freq} ({mode})"
+
+    def get_description(call, timestamp):
+        rbn_url = f"https://www.reversebeacon.net/main.php?spotted_call={call}&rows=100"
+        qrz_url = f"https://www.qrz.com/db/{call}"
+        return f"{timestamp} • [rbn]({rbn_url}) • [qrz]({qrz_url})\n"
+
+    act = spot.activator
+    freq = spot.khz
+    mode = spot.mode
+    timestamp = spot.time_str
+
+    rbn_msg["embeds"][0]['title'] = get_title(act, mode, freq)
+    rbn_msg["embeds"][0]['description'] = get_description(act, timestamp)
+
+    if summary is None:
+        spotby = f'de {spot.spotter} • {spot.snr} db • {spot.wpm} wpm'
+    else:
+        skimmers = f"{summary.skimmers} skimmer{'s' if summary.skimmers != 1 else ''}"
+        spotby = f'{skimmers} • best {summary.best_snr} db de {summary.best_skimmer}'
+        if summary.skimmers > 1:
+            spotby += f' • median {summary.median_snr:.0f} db'
+        if summary.wpm is not None:
+            spotby += f' • {summary.wpm:.0f} wpm'
+        if summary.regions:
+            spotby += f"\n{', '.join(summary.regions)}"
+    rbn_msg["embeds"][0]['fields'][1]['value'] = spotby
+
+    return rbn_msg
+
+
+def build_program_embed(spot: Spot) -> str:
+    '''
+    Embed for spots from the other programs (SOTA, WWFF)
+
+    @param spot Spot: a spot from one of the sources
+    '''
+    def get_ref_url(program, ref):
+        if program is Program.SOTA:
+            return f"https://www.sotadata.org.uk/en/summit/{ref}"
+        return f"https://wwff.co/directory/?showRef={ref}"
+
+    def get_description(program, ref, call, timestamp):
+        ref_url = get_ref_url(program, ref)
+        qrz_url = f"https://www.qrz.com/db/{call}"
+        return f"{timestamp} • [{program.value.lower()}]({ref_url}) • [qrz]({qrz_url})"
+
+    act = spot.activator
+    program = spot.program
+    reference = spot.reference
+
+    program_msg["embeds"][0]['title'] = f"{act} — *{reference}*  —  {spot.khz} ({spot.mode})"
+    program_msg["embeds"][0]['description'] = get_description(program, reference, act, spot.time_str)
+    program_msg["embeds"][0]['fields'][0]['value'] = program.value
+    program_msg["embeds"][0]['fields'][1]['value'] = f"{spot.name}\n{spot.location}"
+    program_msg["embeds"][0]['fields'][2]['value'] = spot.comments
+
+    return program_msg
+
+
+def split_mentions(content: str, user_ids: list[int], limit: int = MAX_CONTENT) -> list[str]:
+    '''
+    Add user mentions to a message. Mentions that would make it longer than
+    discord allows go into as many follow up messages as needed.
+    '''
+    messages = [content]
+    for user_id in user_ids:
+        mention = f'<@{user_id}>'
+        if len(messages[-1]) + 1 + len(mention) > limit:
+            messages.append(mention)
+        else:
+            messages[-1] += ' ' + mention
+    return messages
+
+
+class Storage:
+    def __init__(self, clock: Clock = None):
+        self.schedule = None
+        self.spots = {}
+        # program -> Hz within which a spot is still the same signal
+        self.tolerance = {}
+        self.clock = clock or Clock()
+
+    def add_spot(self, spot: Spot):
+        self.spots[spot.activator] = {
+            'timestamp': self.clock.now(),
+            'spot': spot,
+            'qrt': False
+        }
+
+    def check_freq(self, a: int, b: int, program: Program = None):
+        # frequencies are in Hz. a change of 0.2 kHz or more is a QSY.
+        # skimmers hearing one signal are further apart than that, for RBN
+        # the skimmer aggregator's tolerance is used
+        tolerance = self.tolerance.get(program)
+        if tolerance is not None:
+            return abs(a - b) > tolerance
+        return (abs(a - b) >= 200)
+
+    def check_spot(self, spot: Spot):
+        act = spot.activator
+        cmt = spot.comments
+        new_time = spot.time
+
+        # if for some reason this spot is super old we dont want to process it
+        # at all. assume it's in the list by mistake.
+        #   (RBN started ignoring max age for ex)
+        if (self.clock.now() - new_time) > timedelta(minutes=31):
+            return False
+
+        old_spot = self.spots.get(act)
+        if old_spot is None:
+            if "qrt" not in cmt.lower():
+                self.add_spot(spot)
+                return True
+        else:
+            old_freq = old_spot['spot'].hz
+            old_mode = old_spot['spot'].mode
+            new_freq = spot.hz
+            new_mode = spot.mode
+
+            freq_changed = self.check_freq(old_freq, new_freq, spot.program)
+
+            if freq_changed and not new_mode.startswith('FT'):
+                self.add_spot(spot)
+                return True
+            elif old_mode != new_mode:
+                self.add_spot(spot)
+                return True
+            elif "qrt" in cmt.lower() and not old_spot['qrt'] and new_time >= old_spot['spot'].time:
+                # a QRT spotted before the stored spot (ex: a newer RBN spot
+                # replaced the one the QRT was already posted for) is old news
+                old_spot['qrt'] = True
+                return True
+        return False
+
+    def expire(self):
+        # remove any old spots we have
+        now = self.clock.now()
+        for act in list(self.spots.keys()):
+            if now - self.spots[act]['timestamp'] > timedelta(minutes=30):
+                del self.spots[act]
+
+    def dump(self) -> list[dict]:
+        '''The stored spots as JSON values, see `load`'''
+        return [{
+            'timestamp': x['timestamp'].isoformat(),
+            'spot': x['spot'].to_dict(),
+            'qrt': x['qrt']
+        } for x in self.spots.values()]
+
+    def load(self, rows: list[dict]):
+        spots = {}
+        for row in rows:
+            spot = Spot.from_dict(row['spot'])
+            spots[spot.activator] = {
+                'timestamp': parse_time(row['timestamp']),
+                'spot': spot,
+                'qrt': row['qrt']
+            }
+        self.spots = spots
+
+    def get_schedule(self) -> any:
+        try:
+            with open(file="schedule.json", mode="r", encoding='utf8') as f:
+                lines = f.read()
+                self.schedule = json.loads(lines)
+        except Exception as ex:
+            print(f"Error getting schedule file: {ex}")
+            log.error("Error getting schedule file", exc_info=ex)
+            self.schedule = None
+
+        return self.schedule
+
+
+class Poller:
+    '''
+    Fetches spots for the tracked callsigns once per `tick` and posts the new
+    ones through the given delivery backend. Users subscribed to a spot are
+    sent a DM or mentioned in the post.
+
+    With a lease only the instance holding it polls and posts. The other one
+    is a standby that keeps loading the holder's state in `check_lease`.
+    '''
+
+    def __init__(self, delivery: Delivery, cfg, history: SpotHistory,
+                 subscriptions: Subscriptions = None, sources: list[SpotSource] = None,
+                 clock: Clock = None, lease: Lease = None):
+        self.delivery = delivery
+        self.cfg = cfg
+        self.history = history
+        self.subscriptions = subscriptions
+        self.sources = sources if sources is not None else make_sources()
+        self.clock = clock or Clock()
+        self.storage = Storage(self.clock)
+        for src in self.sources:
+            if src.program is Program.RBN:
+                self.storage.tolerance[Program.RBN] = src.skimmers.tolerance
+        self.lease = lease
+        self.leader = False
+        # source cursors as of the end of the last tick. fetching moves the
+        # cursors past spots that aren't posted yet, a takeover in the middle
+        # of a tick fetches them again (the posted ones are in storage)
+        self.source_state = {}
+
+    def is_active(self) -> bool:
+        '''True if this instance should post'''
+        return self.lease is None or self.lease.is_held()
+
+    def get_state(self) -> dict:
+        return {
+            'spots': self.storage.dump(),
+            'sources': self.source_state,
+        }
+
+    def set_state(self, state: dict):
+        self.storage.load(state.get('spots', []))
+        sources = state.get('sources', {})
+        for src in self.sources:
+            src.load_state(sources.get(src.program.value, {}))
+        self.source_state = sources
+
+    async def save_state(self):
+        if self.lease is None:
+            return
+        if not await asyncio.to_thread(self.lease.save_state, json.dumps(self.get_state())):
+            log.warning("lease lost while saving spot state")
+
+    async def load_state(self):
+        data = await asyncio.to_thread(self.lease.load_state)
+        if data:
+            self.set_state(json.loads(data))
+
+    async def check_lease(self, session):
+        '''
+        Renew the lease, or take it over when the active instance stopped
+        renewing it. Run every few seconds, more often than `tick`.
+        '''
+        held = await asyncio.to_thread(self.lease.acquire)
+        if held and not self.leader:
+            # pick up the posted spots and RBN cursor of the last holder
+            await self.load_state()
+            log.info(f"{self.lease.holder} is now the active spot poller")
+        elif not held:
+            if self.leader:
+                log.warning(f"{self.lease.holder} lost the lease, now on standby")
+            await self.load_state()
+
+            # keep the activator info cache warm for spots that may QSY
+            for x in self.storage.spots.values():
+                if x['spot'].program is Program.POTA:
+                    await get_activator_stats(session, x['spot'].activator)
+        self.leader = held
+
+    async def post(self, content: str, embeds: list[dict] = None) -> bool:
+        '''Send a message, only while this instance is active'''
+        if not self.is_active():
+            log.warning("not the active spot poller, message dropped")
+            return False
+        await self.delivery.send(content, embeds)
+        # save after every post so a takeover never posts it again
+        await self.save_state()
+        return True
+
+    async def fetch(self, session, source: SpotSource, calls: set[str]) -> list[Spot]:
+        '''Fetch from one source. Errors don't stop the other sources.'''
+        try:
+            return await source.fetch(session, calls, self.cfg)
+        except SourceError as ex:
+            await self.post(f'<@&{self.cfg.ping_role}> {ex}')
+        except Exception as ex:
+            log.error(f"Error getting spots from {source.program.value}", exc_info=ex)
+        return []
+
+    async def tick(self, session):
+        if not self.is_active():
+            return
+
+        # taken before any await so slow callsign loads don't shift the
+        # source schedule
+        now = self.clock.monotonic()
+        calls = set(await get_callsign_list())
+        ping_role = self.cfg.ping_role
+        if self.subscriptions is not None:
+            self.subscriptions.reload_if_changed()
+
+        # every enabled source that is due is fetched at the same time
+        enabled = self.cfg.sources
+        due = [src for src in self.sources if src.program.value in enabled and src.is_due(now)]
+        for src in due:
+            src.last_fetch = now
+        results = await asyncio.gather(*[self.fetch(session, src, calls) for src in due])
+        spots = [spot for result in results for spot in result]
+
+        # log.info(f"all spots {json.dumps(spots, indent=2)}")
+
+        for spot in spots:
+            program = spot.program
+
+            if spot.basecall in calls:
+                must_send = self.storage.check_spot(spot)
+
+                # RBN spots are only returned once (last_id) so keep all
+                # of them for SNR stats. other spots repeat every fetch
+                if program is Program.RBN or must_send:
+                    self.history.record(spot)
+
+                if must_send:
+                    if program is Program.RBN:
+                        msg = build_rbn_embed(spot, self.skimmer_summary(spot))
+                    elif program is Program.POTA:
+                        msg = await build_pota_embed(session, spot, self.cfg.home_grid)
+                    else:
+                        msg = build_program_embed(spot)
+
+                    content = f'<@&{ping_role}> {program.value} SPOT'
+                    embeds = [msg['embeds'][0]]
+                    mentions = await self.notify_subscribers(spot, embeds)
+                    messages = split_mentions(content, mentions)
+
+                    # the spot goes first, mentions that don't fit follow it
+                    await self.post(messages[0], embeds)
+                    for extra in messages[1:]:
+                        await self.post(extra)
+        self.storage.expire()
+        self.source_state = {src.program.value: src.save_state() for src in self.sources}
+        await self.save_state()
+
+    def skimmer_summary(self, spot: Spot) -> SkimmerSummary | None:
+        for src in self.sources:
+            if src.program is Program.RBN:
+                return src.skimmers.summary(spot.activator, spot.hz)
+        return None
+
+    async def notify_subscribers(self, spot: Spot, embeds: list[dict]) -> list[int]:
+        '''
+        DM the users subscribed to this spot. Returns the user ids that should
+        be mentioned in the channel post instead, including any DMs that
+        failed. DMs don't ping the channel role.
+        '''
+        if self.subscriptions is None or not self.is_active():
+            return []
+
+        subs = self.subscriptions.match(spot.basecall, spot.band, spot.mode)
+        mentions = [user_id for user_id, how in subs if how != 'dm']
+        dms = [user_id for user_id, how in subs if how == 'dm']
+
+        if dms:
+            content = f'{spot.program.value} SPOT of {spot.activator}'
+            sent = await asyncio.gather(
+                *[self.delivery.send_dm(user_id, content, embeds) for user_id in dms])
+            mentions += [user_id for user_id, ok in zip(dms, sent) if not ok]
+        return mentions
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from bands import BANDS
+
+log = logging.getLogger("discord")
+sub_lock = threading.Lock()
+
+BAND_NAMES = [b[2] for b in BANDS]
+DELIVERY_TYPES = ('mention', 'dm')
+
+
+class Subscriptions:
+    '''
+    Per user spot subscriptions stored in subscriptions.json.
+
+    Each user has a set of base callsigns plus optional band and mode
+    filters, and a delivery type ('mention' in the spot post or 'dm').
+
+    Matching a spot uses an inverted index keyed by (basecall, band), band
+    is None for users without a band filter. Only the users found in the
+    index are checked against their mode filter, so matching doesn't depend
+    on the total number of subscriptions.
+    '''
+
+    def __init__(self, path: str = "subscriptions.json"):
+        self.path = path
+        self.users = {}
+        self._index = defaultdict(set)
+        self._mtime = None
+        self.load()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload_if_changed(self) -> bool:
+        '''Reload the file if it was changed by another process'''
+        if self._file_mtime() == self._mtime:
+            return False
+        self.load()
+        return True
+
+    def load(self):
+        self._mtime = self._file_mtime()
+        try:
+            with open(file=self.path, mode="r", encoding='utf8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        except Exception as ex:
+            log.error("Error getting subscriptions file", exc_info=ex)
+            data = {}
+
+        self.users = {}
+        self._index = defaultdict(set)
+        for user_id, sub in data.items():
+            self.users[int(user_id)] = {
+                'calls': set(sub.get('calls', [])),
+                'bands': set(sub.get('bands', [])),
+                'modes': set(sub.get('modes', [])),
+                'delivery': sub.get('delivery', 'mention'),
+            }
+            self._index_user(int(user_id))
+
+    def save(self):
+        data = {
+            str(user_id): {
+                'calls': sorted(sub['calls']),
+                'bands': sorted(sub['bands']),
+                'modes': sorted(sub['modes']),
+                'delivery': sub['delivery'],
+            } for user_id, sub in self.users.items()
+        }
+        with sub_lock:
+            with open(file=self.path, mode='w', encoding='utf8') as w:
+                json.dump(data, w, indent=4)
+            self._mtime = self._file_mtime()
+
+    def get(self, user_id: int) -> dict | None:
+        return self.users.get(user_id)
+
+    def match(self, basecall: str, band: str, mode: str) -> list[tuple[int, str]]:
+        '''
+        Return (user id, delivery type) for every user subscribed to a spot
+        '''
+        users = self._index.get((basecall, band), set()) | self._index.get((basecall, None), set())
+        mode = str(mode).upper()
+
+        result = []
+        for user_id in users:
+            sub = self.users[user_id]
+            if sub['modes'] and mode not in sub['modes']:
+                continue
+            result.append((user_id, sub['delivery']))
+        return result
+
+    def add_call(self, user_id: int, basecall: str):
+        self._update(user_id, lambda sub: sub['calls'].add(basecall))
+
+    def remove_call(self, user_id: int, basecall: str):
+        self._update(user_id, lambda sub: sub['calls'].discard(basecall))
+
+    def set_bands(self, user_id: int, bands: list[str]):
+        bands = {b.strip().lower() for b in bands if b.strip()}
+        bad = bands - set(BAND_NAMES)
+        if bad:
+            raise ValueError(f"unknown band(s): {', '.join(sorted(bad))}")
+        self._update(user_id, lambda sub: sub.update(bands=bands))
+
+    def set_modes(self, user_id: int, modes: list[str]):
+        modes = {m.strip().upper() for m in modes if m.strip()}
+        self._update(user_id, lambda sub: sub.update(modes=modes))
+
+    def set_delivery(self, user_id: int, delivery: str):
+        if delivery not in DELIVERY_TYPES:
+            raise ValueError(f"delivery must be one of {', '.join(DELIVERY_TYPES)}")
+        self._update(user_id, lambda sub: sub.update(delivery=delivery))
+
+    def remove_user(self, user_id: int):
+        if user_id not in self.users:
+            return
+        self._unindex_user(user_id)
+        del self.users[user_id]
+        self.save()
+
+    def _update(self, user_id: int, change):
+        sub = self.users.get(user_id)
+        if sub is None:
+            sub = {'calls': set(), 'bands': set(), 'modes': set(), 'delivery': 'mention'}
+            self.users[user_id] = sub
+        else:
+            self._unindex_user(user_id)
+
+        change(sub)
+        self._index_user(user_id)
+        self.save()
+
+    def _keys(self, user_id: int):
+        sub = self.users[user_id]
+        bands = sub['bands'] or [None]
+        return [(call, band) for call in sub['calls'] for band in bands]
+
+    def _index_user(self, user_id: int):
+        for key in self._keys(user_id):
+            self._index[key].add(user_id)
+
+    def _unindex_user(self, user_id: int):
+        for key in self._keys(user_id):
+            users = self._index.get(key)
+            if users is None:
+                continue
+            users.discard(user_id)
+            if not users:
+                del self._index[key]
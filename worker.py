@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import sys
+
+import aiohttp
+
+from config import Config
+from delivery import WebhookDelivery
+from history import SpotHistory
+from lease import Lease
+from spots import Poller, park_index
+from subscriptions import Subscriptions
+
+# Standalone spot poster. Posts spots through WEBHOOK_URL without a discord
+# gateway connection. Run it next to bot.py with DISABLE_SPOT_TASK=1 set for
+# the bot so the bot only handles slash commands and scheduled messages.
+
+log = logging.getLogger("discord")
+
+
+async def every(seconds: float, func):
+    '''Run `func` forever, waiting `seconds` between the start of each run'''
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        try:
+            await func()
+        except Exception as ex:
+            log.error(f"Error in {func.__name__}", exc_info=ex)
+        await asyncio.sleep(max(0, seconds - (loop.time() - start)))
+
+
+async def main():
+    cfg = Config(required=Config.WORKER_REQUIRED)
+    history = SpotHistory()
+    delivery = WebhookDelivery(cfg.webhook_url)
+    lease = Lease(cfg.lease_db, cfg.instance_name, cfg.lease_ttl) if cfg.lease_db else None
+    poller = Poller(delivery, cfg, history, Subscriptions(), lease=lease)
+
+    async with aiohttp.ClientSession() as session:
+        async def poll_spots():
+            cfg.reload_if_changed()
+            await poller.tick(session)
+
+        async def refresh_parks():
+            if park_index.is_stale(24 * 60 * 60):
+                await park_index.refresh(session)
+
+        async def check_lease():
+            await poller.check_lease(session)
+
+        loops = [
+            every(15, poll_spots),
+            every(15, history.flush),
+            every(60 * 60, refresh_parks)]
+        if lease is not None:
+            # renewed a few times per ttl so the standby only takes over
+            # when this instance is really gone
+            loops.insert(0, every(lease.ttl / 3, check_lease))
+
+        try:
+            await asyncio.gather(*loops)
+        finally:
+            await history.flush()
+            await delivery.close()
+            if poller.leader:
+                lease.release()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)-8s %(name)s %(message)s")
+    asyncio.run(main())